@@ -2,13 +2,28 @@
 """frederick-matrix unified management CLI.
 
 Usage:
-    ./manage.py setup
+    ./manage.py [--trace FILE] [--trace-summary [--trace-top N]] <command> ...
+    ./manage.py setup [--profile small|medium|large|auto] [--workers N]
     ./manage.py up
     ./manage.py down
-    ./manage.py status [docker|localhost|tunnel|pages] [-q]
+    ./manage.py status [docker|localhost|tunnel|pages|cache] [-q]
     ./manage.py tunnel restart
     ./manage.py tunnel url
-    ./manage.py publish
+    ./manage.py tunnel bench [--concurrency N] [--duration S] [--size MB]
+    ./manage.py publish [--wait]
+    ./manage.py backup [--dest DIR]
+    ./manage.py restore [snapshot] [--check] [--force]
+    ./manage.py media audit [--top N] [--workers N] [--by-room]
+    ./manage.py media purge --older-than 30d [--timeout S]
+    ./manage.py users list [--order-by FIELD] [--limit N]
+    ./manage.py rooms list [--order-by FIELD] [--search TERM] [--limit N]
+    ./manage.py rooms purge-history --before 90d [--rooms ID ...] [--workers N]
+    ./manage.py rooms apply [rooms.yaml|SPEC.json] [--dry-run]
+    ./manage.py db stats [--top N]
+    ./manage.py db maintain [--full] [--query SQL]
+    ./manage.py loadtest [--users N] [--rate MSG/S] [--duration S] [--target URL | --tunnel]
+    ./manage.py metrics [--diff SECONDS] [--top N] [--sort total|p95]
+    ./manage.py logs analyze [--since 1h] [--follow [--window S]] [--top N]
     ./manage.py token create [--uses N] [--expires 7d]
     ./manage.py token list [--active]
     ./manage.py token revoke <token>
@@ -25,10 +40,26 @@ def main() -> None:
         description=__doc__,
         formatter_class=argparse.RawDescriptionHelpFormatter,
     )
+    parser.add_argument("--trace", metavar="FILE", help="Write Chrome trace-event JSON for this run to FILE")
+    parser.add_argument("--trace-summary", action="store_true", help="Print the top spans by self time")
+    parser.add_argument(
+        "--trace-top", type=int, default=15, metavar="N",
+        help="Number of spans --trace-summary prints (default: 15)",
+    )
     sub = parser.add_subparsers(dest="command", metavar="<command>")
 
     # setup
-    sub.add_parser("setup", help="Full first-time setup")
+    p_setup = sub.add_parser("setup", help="Full first-time setup")
+    p_setup.add_argument(
+        "--profile",
+        choices=["small", "medium", "large", "auto"],
+        default="auto",
+        help="Synapse cache/presence/media tuning (default: auto-detect from cores and RAM)",
+    )
+    p_setup.add_argument(
+        "--workers", type=int, metavar="N",
+        help="Run N generic workers plus a federation sender and a media worker (adds redis, postgres)",
+    )
 
     # up
     sub.add_parser("up", help="Start services, publish tunnel URL, watch for changes")
@@ -41,7 +72,7 @@ def main() -> None:
     p_status.add_argument(
         "section",
         nargs="?",
-        choices=["docker", "localhost", "tunnel", "pages"],
+        choices=["docker", "localhost", "tunnel", "pages", "cache"],
         help="Section to check (default: all)",
     )
     p_status.add_argument("-q", "--quiet", action="store_true", help="Summary only")
@@ -51,9 +82,123 @@ def main() -> None:
     tunnel_sub = p_tunnel.add_subparsers(dest="tunnel_cmd", metavar="<subcommand>")
     tunnel_sub.add_parser("restart", help="Force-recreate cloudflared, wait, publish")
     tunnel_sub.add_parser("url", help="Print and check current tunnel URL")
+    p_bench = tunnel_sub.add_parser("bench", help="Compare latency and throughput: localhost vs the tunnel")
+    p_bench.add_argument("--concurrency", type=int, default=8, help="Concurrent clients per phase (default: 8)")
+    p_bench.add_argument("--duration", type=float, default=10, help="Seconds per phase (default: 10)")
+    p_bench.add_argument("--size", type=float, default=1, help="Test media size in MB (default: 1)")
+    p_bench.add_argument("--local", help="Local base URL (default: http://localhost:8008)")
 
     # publish
-    sub.add_parser("publish", help="One-shot: publish current tunnel URL to GitHub Pages")
+    p_publish = sub.add_parser("publish", help="One-shot: publish current tunnel URL to GitHub Pages")
+    p_publish.add_argument(
+        "--wait", action="store_true",
+        help="Follow the Pages deploy and report how long until the new URL is served",
+    )
+
+    # backup / restore
+    p_backup = sub.add_parser("backup", help="Incremental online backup of data/ (DB, keys, media)")
+    p_backup.add_argument("--dest", help="Backup store directory (default: backups/)")
+
+    p_restore = sub.add_parser("restore", help="Verify and restore a backup snapshot into data/")
+    p_restore.add_argument("snapshot", nargs="?", help="Snapshot name (default: latest)")
+    p_restore.add_argument("--source", help="Backup store directory (default: backups/)")
+    p_restore.add_argument("--target", help="Directory to restore into (default: data/)")
+    p_restore.add_argument("--check", action="store_true", help="Verify checksums only, write nothing")
+    p_restore.add_argument("--force", action="store_true", help="Overwrite an existing homeserver.db")
+
+    # media
+    p_media = sub.add_parser("media", help="Media store audit and cleanup")
+    media_sub = p_media.add_subparsers(dest="media_cmd", metavar="<subcommand>")
+    p_audit = media_sub.add_parser("audit", help="Report media store size, sources and duplicates")
+    p_audit.add_argument("--top", type=int, default=10, help="Rows per table (default: 10)")
+    p_audit.add_argument("--workers", type=int, help="Hashing processes (default: CPU count)")
+    p_audit.add_argument("--by-room", action="store_true", help="Also attribute media to rooms (scans all messages)")
+    p_purge = media_sub.add_parser("purge", help="Purge cached remote media via the admin API")
+    p_purge.add_argument("--older-than", required=True, help="Age cutoff (e.g. 1h, 30d, 4w)")
+    p_purge.add_argument("--timeout", type=int, help="Seconds to wait for Synapse to finish (default: 3600)")
+
+    # users / rooms
+    p_users = sub.add_parser("users", help="Query users on this homeserver")
+    users_sub = p_users.add_subparsers(dest="users_cmd", metavar="<subcommand>")
+    p_ulist = users_sub.add_parser("list", help="Stream users as NDJSON")
+    p_ulist.add_argument("--order-by", choices=["name", "creation_ts", "last_seen_ts", "media_length"], default="name", help="Server-side sort (default: name)")
+    p_ulist.add_argument("--deactivated", action="store_true", help="Include deactivated users")
+
+    p_rooms = sub.add_parser("rooms", help="Query and manage rooms on this homeserver")
+    rooms_sub = p_rooms.add_subparsers(dest="rooms_cmd", metavar="<subcommand>")
+    p_rlist = rooms_sub.add_parser("list", help="Stream rooms as NDJSON")
+    p_rlist.add_argument(
+        "--order-by",
+        choices=["state_events", "joined_members", "joined_local_members", "name", "version"],
+        default="state_events",
+        help="Server-side sort (default: state_events, i.e. heaviest first)",
+    )
+    p_rlist.add_argument("--search", help="Filter by room name/alias/ID")
+
+    p_rpurge = rooms_sub.add_parser("purge-history", help="Purge old room history via admin purge jobs")
+    p_rpurge.add_argument("--before", required=True, help="Purge events older than this (e.g. 90d, 12w)")
+    p_rpurge.add_argument("--rooms", nargs="+", metavar="ROOM_ID", help="Rooms to purge (default: all)")
+    p_rpurge.add_argument("--workers", type=int, default=4, help="Concurrent purge jobs (default: 4)")
+    p_rpurge.add_argument(
+        "--delete-local", action="store_true",
+        help="Also delete events sent by local users (default: keep them)",
+    )
+
+    p_rapply = rooms_sub.add_parser("apply", help="Create/update rooms to match a declarative spec")
+    p_rapply.add_argument("spec", nargs="?", default="rooms.yaml", help="Room spec, YAML or .json (default: rooms.yaml)")
+    p_rapply.add_argument("--dry-run", action="store_true", help="Show what would change without writing")
+
+    for p in (p_ulist, p_rlist):
+        p.add_argument("--dir", choices=["f", "b"], default="b", help="Sort direction (default: b, descending)")
+        p.add_argument("--limit", type=int, help="Stop after N rows")
+        p.add_argument("--page-size", type=int, default=100, help="Rows per admin API request (default: 100)")
+
+    # db
+    p_db = sub.add_parser("db", help="SQLite database stats and maintenance")
+    db_sub = p_db.add_subparsers(dest="db_cmd", metavar="<subcommand>")
+    p_dbstats = db_sub.add_parser("stats", help="Per-table/index sizes and free space (read-only)")
+    p_dbstats.add_argument("--top", type=int, default=15, help="Rows in the size table (default: 15)")
+    p_dbmaint = db_sub.add_parser("maintain", help="Stop synapse, ANALYZE, vacuum, checkpoint WAL, restart")
+    p_dbmaint.add_argument(
+        "--full", action="store_true",
+        help="Run a full VACUUM and enable incremental auto_vacuum (slow, needs free disk space)",
+    )
+    p_dbmaint.add_argument("--query", help="Sample query to time before and after")
+    for p in (p_dbstats, p_dbmaint):
+        p.add_argument("--db", help="Database path (default: data/homeserver.db)")
+
+    # loadtest
+    p_load = sub.add_parser("loadtest", help="Register users, send messages, report send-to-sync latency")
+    p_load.add_argument("--users", type=int, default=10, help="Users to register (default: 10)")
+    p_load.add_argument("--rate", type=float, default=5.0, help="Total messages per second (default: 5)")
+    p_load.add_argument("--duration", type=int, default=30, help="Seconds of sending (default: 30)")
+    target = p_load.add_mutually_exclusive_group()
+    target.add_argument("--target", help="Client API base URL (default: server_url from token configure)")
+    target.add_argument("--tunnel", action="store_true", help="Send client traffic through the tunnel URL")
+    p_load.add_argument("--keep-users", action="store_true", help="Don't deactivate the test users afterwards")
+
+    # metrics
+    p_metrics = sub.add_parser("metrics", help="Synapse hot-spot report from Prometheus metrics")
+    p_metrics.add_argument(
+        "--diff", type=int, metavar="SECONDS",
+        help="Scrape twice, SECONDS apart, and report only what changed",
+    )
+    p_metrics.add_argument("--top", type=int, default=10, help="Rows per table (default: 10)")
+    p_metrics.add_argument(
+        "--sort", choices=["total", "p95"], default="total",
+        help="Order servlets by total time or p95 latency (default: total)",
+    )
+    p_metrics.add_argument("--url", help="Metrics URL (default: http://localhost:9000/_synapse/metrics)")
+
+    # logs
+    p_logs = sub.add_parser("logs", help="Analyze Synapse container logs")
+    logs_sub = p_logs.add_subparsers(dest="logs_cmd", metavar="<subcommand>")
+    p_lanalyze = logs_sub.add_parser("analyze", help="Per-endpoint latency from Synapse request lines")
+    p_lanalyze.add_argument("--since", help="Only logs newer than this (e.g. 30m, 1h, 2d)")
+    p_lanalyze.add_argument("--follow", action="store_true", help="Keep reading and print rolling-window stats")
+    p_lanalyze.add_argument("--window", type=int, default=300, help="Rolling window for --follow, in seconds (default: 300)")
+    p_lanalyze.add_argument("--interval", type=int, default=10, help="Seconds between --follow reports (default: 10)")
+    p_lanalyze.add_argument("--top", type=int, default=15, help="Endpoints to show (default: 15)")
 
     # token
     p_token = sub.add_parser("token", help="Registration token management")
@@ -80,6 +225,12 @@ def main() -> None:
         parser.print_help()
         sys.exit(1)
 
+    if args.trace or args.trace_summary:
+        import atexit
+        from manage import trace
+        trace.enable(f"manage.py {args.command}")
+        atexit.register(trace.finish, args.trace, args.trace_top if args.trace_summary else None)
+
     if args.command == "setup":
         from manage.setup import cmd_setup
         cmd_setup(args)
@@ -107,6 +258,57 @@ def main() -> None:
         from manage.tunnel import cmd_publish
         cmd_publish(args)
 
+    elif args.command == "backup":
+        from manage.backup import cmd_backup
+        cmd_backup(args)
+
+    elif args.command == "restore":
+        from manage.backup import cmd_restore
+        cmd_restore(args)
+
+    elif args.command == "media":
+        if not args.media_cmd:
+            p_media.print_help()
+            sys.exit(1)
+        from manage.media import cmd_media
+        cmd_media(args)
+
+    elif args.command == "users":
+        if not args.users_cmd:
+            p_users.print_help()
+            sys.exit(1)
+        from manage.admin import cmd_users
+        cmd_users(args)
+
+    elif args.command == "rooms":
+        if not args.rooms_cmd:
+            p_rooms.print_help()
+            sys.exit(1)
+        from manage.admin import cmd_rooms
+        cmd_rooms(args)
+
+    elif args.command == "db":
+        if not args.db_cmd:
+            p_db.print_help()
+            sys.exit(1)
+        from manage.db import cmd_db
+        cmd_db(args)
+
+    elif args.command == "loadtest":
+        from manage.loadtest import cmd_loadtest
+        cmd_loadtest(args)
+
+    elif args.command == "metrics":
+        from manage.metrics import cmd_metrics
+        cmd_metrics(args)
+
+    elif args.command == "logs":
+        if not args.logs_cmd:
+            p_logs.print_help()
+            sys.exit(1)
+        from manage.logs import cmd_logs
+        cmd_logs(args)
+
     elif args.command == "token":
         if not args.token_cmd:
             p_token.print_help()
@@ -0,0 +1,327 @@
+"""Admin queries — users and rooms on this homeserver.
+
+Rows are streamed as NDJSON as soon as each page arrives, so the output
+can be piped into `jq`, `head` or `sort` without loading everything first.
+"""
+
+import json
+import sqlite3
+import sys
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from manage import trace
+from manage.tokens import SynapseError, load_config, synapse_paginate, synapse_request
+
+PURGE_POLL_INTERVAL = 2
+PURGE_WORKERS = 4
+COUNT_BATCH = 500  # room IDs per IN (...) query, under SQLite's variable limit
+APPLY_WORKERS = 8
+MERGED_POWER_KEYS = ("users", "events", "notifications")
+
+
+def _emit(rows, limit: int | None) -> None:
+    """Print rows as NDJSON, stopping after `limit` rows."""
+    count = 0
+    try:
+        for row in rows:
+            print(json.dumps(row), flush=True)
+            count += 1
+            if limit and count >= limit:
+                break
+    except BrokenPipeError:
+        sys.stderr.close()
+        sys.exit(0)
+
+
+def _users_list(args) -> None:
+    config = load_config()
+    order_by = getattr(args, "order_by", None) or "name"
+    params = {"order_by": order_by, "dir": getattr(args, "dir", None) or "b"}
+    if order_by == "media_length":
+        rows = synapse_paginate("/_synapse/admin/v1/statistics/users/media", config, "users", params, args.page_size)
+    else:
+        if not getattr(args, "deactivated", False):
+            params["deactivated"] = "false"
+        rows = synapse_paginate("/_synapse/admin/v2/users", config, "users", params, args.page_size)
+    _emit(rows, getattr(args, "limit", None))
+
+
+def _rooms_list(args) -> None:
+    config = load_config()
+    params = {
+        "order_by": getattr(args, "order_by", None) or "state_events",
+        "dir": getattr(args, "dir", None) or "b",
+    }
+    search = getattr(args, "search", None)
+    if search:
+        params["search_term"] = search
+    rows = synapse_paginate("/_synapse/admin/v1/rooms", config, "rooms", params, args.page_size)
+    _emit(rows, getattr(args, "limit", None))
+
+
+def _event_counts(room_ids: list[str]) -> dict[str, int] | None:
+    """Events per room from a read-only view of the Synapse DB, if available."""
+    from manage.backup import DATA_DIR, DB_NAME, uses_postgres
+
+    if uses_postgres():
+        return None  # homeserver.db is stale after the Postgres port
+    try:
+        conn = sqlite3.connect(f"file:{DATA_DIR / DB_NAME}?mode=ro", uri=True)
+        counts = {}
+        for i in range(0, len(room_ids), COUNT_BATCH):
+            batch = room_ids[i:i + COUNT_BATCH]
+            counts.update(conn.execute(
+                f"SELECT room_id, COUNT(*) FROM events WHERE room_id IN ({','.join('?' * len(batch))})"
+                " GROUP BY room_id",
+                batch,
+            ))
+        conn.close()
+    except sqlite3.Error:
+        return None
+    return {room_id: counts.get(room_id, 0) for room_id in room_ids}
+
+
+@trace.traced("purge job")
+def _purge_room(config: dict, room_id: str, before_ts: int, delete_local: bool) -> tuple[str, str, str | None]:
+    """Start a purge job for one room and poll it to completion."""
+    quoted = urllib.parse.quote(room_id)
+    try:
+        job = synapse_request(
+            "POST", f"/_synapse/admin/v1/purge_history/{quoted}", config,
+            body={"purge_up_to_ts": before_ts, "delete_local_events": delete_local},
+            raise_errors=True,
+        )
+        purge_id = job["purge_id"]
+        while True:
+            status = synapse_request(
+                "GET", f"/_synapse/admin/v1/purge_history_status/{purge_id}", config, raise_errors=True
+            )
+            if status.get("status") != "active":
+                return room_id, status.get("status", "?"), status.get("error")
+            time.sleep(PURGE_POLL_INTERVAL)
+    except SynapseError as e:
+        return room_id, "failed", e.message
+    except OSError as e:
+        return room_id, "failed", str(getattr(e, "reason", e))
+
+
+def _rooms_purge_history(args) -> None:
+    from manage.tokens import parse_duration
+
+    config = load_config()
+    before_ts = parse_duration(args.before, past=True)
+    room_ids = args.rooms or [r["room_id"] for r in synapse_paginate("/_synapse/admin/v1/rooms", config, "rooms")]
+    if not room_ids:
+        print("No rooms to purge.")
+        return
+
+    workers = getattr(args, "workers", None) or PURGE_WORKERS
+    print(f"Purging history older than {args.before} in {len(room_ids)} rooms ({workers} at a time)...")
+    before_counts = _event_counts(room_ids)
+
+    started = time.time()
+    results: dict[str, int] = {}
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(_purge_room, config, room_id, before_ts, args.delete_local)
+            for room_id in room_ids
+        ]
+        for done, future in enumerate(as_completed(futures), 1):
+            room_id, status, error = future.result()
+            results[status] = results.get(status, 0) + 1
+            detail = f" ({error})" if error else ""
+            print(f"  [{done}/{len(room_ids)}] {room_id}: {status}{detail}")
+
+    summary = ", ".join(f"{n} {status}" for status, n in sorted(results.items()))
+    print(f"\nRooms: {summary} in {time.time() - started:.1f}s")
+    after_counts = _event_counts(room_ids)
+    if before_counts is not None and after_counts is not None:
+        purged = sum(before_counts[r] - after_counts[r] for r in room_ids)
+        print(f"Events purged: {purged}")
+    else:
+        print("Events purged: unknown (needs a readable SQLite data/homeserver.db)")
+
+
+def _load_spec(path: str) -> list[dict]:
+    """Rooms from a spec file: JSON if it ends in .json, otherwise YAML (needs PyYAML)."""
+    try:
+        with open(path) as f:
+            text = f.read()
+    except OSError as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        sys.exit(1)
+    if path.endswith(".json"):
+        try:
+            spec = json.loads(text)
+        except json.JSONDecodeError as e:
+            print(f"ERROR: {path} is not valid JSON: {e}", file=sys.stderr)
+            sys.exit(1)
+    else:
+        try:
+            import yaml
+        except ImportError:
+            print(
+                f"ERROR: reading {path} needs PyYAML: pip install pyyaml\n"
+                "       (or pass the same spec as a .json file)",
+                file=sys.stderr,
+            )
+            sys.exit(1)
+        try:
+            spec = yaml.safe_load(text)
+        except yaml.YAMLError as e:
+            print(f"ERROR: {path} is not valid YAML: {e}", file=sys.stderr)
+            sys.exit(1)
+    rooms = (spec or {}).get("rooms", [])
+    for room in rooms:
+        if not room.get("alias"):
+            print(f"ERROR: every room in {path} needs an alias: {room}", file=sys.stderr)
+            sys.exit(1)
+    return rooms
+
+
+def _full_alias(alias: str, server_name: str) -> str:
+    alias = alias if alias.startswith("#") else f"#{alias}"
+    return alias if ":" in alias else f"{alias}:{server_name}"
+
+
+def _merge_power_levels(current: dict, declared: dict) -> dict:
+    merged = dict(current)
+    for key, value in declared.items():
+        if key in MERGED_POWER_KEYS and isinstance(value, dict):
+            merged[key] = dict(current.get(key, {}), **value)
+        else:
+            merged[key] = value
+    return merged
+
+
+def _read_room(config: dict, alias: str) -> tuple[str | None, dict]:
+    """Resolve an alias and fetch the room's current state as {event type: content}."""
+    try:
+        directory = synapse_request(
+            "GET", f"/_matrix/client/v3/directory/room/{urllib.parse.quote(alias)}", config, raise_errors=True
+        )
+    except SynapseError as e:
+        if e.code == 404:
+            return None, {}
+        raise
+    room_id = directory["room_id"]
+    state = synapse_request(
+        "GET", f"/_synapse/admin/v1/rooms/{urllib.parse.quote(room_id)}/state", config, raise_errors=True
+    )
+    return room_id, {
+        event["type"]: event.get("content", {})
+        for event in state.get("state", [])
+        if event.get("state_key") == ""
+    }
+
+
+def _room_changes(room: dict, state: dict) -> dict[str, dict]:
+    """State events (type -> content) needed to bring `state` in line with `room`."""
+    changes = {}
+    if "name" in room and state.get("m.room.name", {}).get("name") != room["name"]:
+        changes["m.room.name"] = {"name": room["name"]}
+    if "topic" in room and state.get("m.room.topic", {}).get("topic") != room["topic"]:
+        changes["m.room.topic"] = {"topic": room["topic"]}
+    if "join_rule" in room and state.get("m.room.join_rules", {}).get("join_rule") != room["join_rule"]:
+        changes["m.room.join_rules"] = {"join_rule": room["join_rule"]}
+    if "power_levels" in room:
+        current = state.get("m.room.power_levels", {})
+        merged = _merge_power_levels(current, room["power_levels"])
+        if merged != current:
+            changes["m.room.power_levels"] = merged
+    return changes
+
+
+@trace.traced("apply room")
+def _apply_room(config: dict, room: dict, server_name: str, dry_run: bool) -> tuple[str, str, str]:
+    """Create or update one declared room. Returns (alias, outcome, detail)."""
+    alias = _full_alias(room["alias"], server_name)
+    try:
+        room_id, state = _read_room(config, alias)
+        if room_id is None:
+            if dry_run:
+                return alias, "would create", ""
+            join_rule = room.get("join_rule", "public")
+            body = {
+                "room_alias_name": alias[1:].split(":", 1)[0],
+                "preset": "public_chat" if join_rule == "public" else "private_chat",
+                "visibility": "public" if join_rule == "public" else "private",
+            }
+            for key in ("name", "topic"):
+                if key in room:
+                    body[key] = room[key]
+            if join_rule not in ("public", "invite"):
+                body["initial_state"] = [{"type": "m.room.join_rules", "state_key": "", "content": {"join_rule": join_rule}}]
+            if "power_levels" in room:
+                body["power_level_content_override"] = room["power_levels"]
+            created = synapse_request("POST", "/_matrix/client/v3/createRoom", config, body=body, raise_errors=True)
+            return alias, "created", created["room_id"]
+
+        changes = _room_changes(room, state)
+        if not changes:
+            return alias, "unchanged", ""
+        fields = ", ".join(t.removeprefix("m.room.") for t in changes)
+        if dry_run:
+            return alias, "would update", fields
+        quoted = urllib.parse.quote(room_id)
+        for event_type, content in changes.items():
+            synapse_request(
+                "PUT", f"/_matrix/client/v3/rooms/{quoted}/state/{event_type}/", config,
+                body=content, raise_errors=True,
+            )
+        return alias, "updated", fields
+    except SynapseError as e:
+        hint = " (is the admin user in the room with enough power?)" if e.code == 403 else ""
+        return alias, "failed", f"{e.message}{hint}"
+    except OSError as e:
+        return alias, "failed", str(getattr(e, "reason", e))
+
+
+def _rooms_apply(args) -> None:
+    config = load_config()
+    rooms = _load_spec(args.spec)
+    if not rooms:
+        print(f"No rooms declared in {args.spec}.")
+        return
+    whoami = synapse_request("GET", "/_matrix/client/v3/account/whoami", config)
+    server_name = whoami["user_id"].split(":", 1)[1]
+
+    dry_run = getattr(args, "dry_run", False)
+    outcomes: dict[str, int] = {}
+    with ThreadPoolExecutor(max_workers=min(len(rooms), APPLY_WORKERS)) as pool:
+        futures = [pool.submit(_apply_room, config, room, server_name, dry_run) for room in rooms]
+        for future in futures:
+            alias, outcome, detail = future.result()
+            outcomes[outcome] = outcomes.get(outcome, 0) + 1
+            print(f"  {alias}: {outcome}" + (f" ({detail})" if detail else ""))
+
+    summary = ", ".join(f"{n} {outcome}" for outcome, n in sorted(outcomes.items()))
+    print(f"\nRooms: {summary}")
+    if outcomes.get("failed"):
+        sys.exit(1)
+
+
+def cmd_users(args) -> None:
+    """Dispatch users subcommands."""
+    dispatch = {
+        "list": _users_list,
+    }
+    if args.users_cmd not in dispatch:
+        print(f"Unknown users subcommand: {args.users_cmd}", file=sys.stderr)
+        sys.exit(1)
+    dispatch[args.users_cmd](args)
+
+
+def cmd_rooms(args) -> None:
+    """Dispatch rooms subcommands."""
+    dispatch = {
+        "list": _rooms_list,
+        "purge-history": _rooms_purge_history,
+        "apply": _rooms_apply,
+    }
+    if args.rooms_cmd not in dispatch:
+        print(f"Unknown rooms subcommand: {args.rooms_cmd}", file=sys.stderr)
+        sys.exit(1)
+    dispatch[args.rooms_cmd](args)
@@ -0,0 +1,303 @@
+"""Backup and restore of the Synapse data directory.
+
+Every file under data/ is stored once, gzip-compressed, in a
+content-addressed object store (backups/objects/<sha256[:2]>/<sha256>.gz).
+Each run writes a snapshot manifest mapping paths to hashes, so unchanged
+media is never read or copied again. The SQLite database is copied with
+SQLite's online backup API, so Synapse can keep running.
+"""
+
+import fnmatch
+import gzip
+import hashlib
+import json
+import os
+import re
+import shutil
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from pathlib import Path
+
+REPO_ROOT = Path(__file__).parent.parent
+DATA_DIR = REPO_ROOT / "data"
+BACKUP_DIR = REPO_ROOT / "backups"
+DB_NAME = "homeserver.db"
+EXCLUDE = ["homeserver.db*", "*.pid", "homeserver.log*"]
+CHUNK_SIZE = 1024 * 1024
+COMPRESS_LEVEL = 6
+WORKERS = min(8, (os.cpu_count() or 1) * 2)
+POSTGRES_DATABASE = re.compile(r'^database:\n\s+name:\s*"?psycopg2', re.M)
+POSTGRES_HINT = (
+    "Synapse uses PostgreSQL (setup --workers), so data/homeserver.db is stale.\n"
+    "Dump the database instead: docker compose exec -T postgres pg_dump -U synapse synapse > synapse.sql"
+)
+
+
+def uses_postgres(data_dir: Path = DATA_DIR) -> bool:
+    """True once homeserver.yaml points at PostgreSQL; the SQLite file is then stale."""
+    config = data_dir / "homeserver.yaml"
+    return config.exists() and bool(POSTGRES_DATABASE.search(config.read_text()))
+
+
+def _object_path(store: Path, digest: str) -> Path:
+    return store / "objects" / digest[:2] / f"{digest}.gz"
+
+
+def hash_file(path: Path) -> str:
+    h = hashlib.sha256()
+    with path.open("rb") as f:
+        while chunk := f.read(CHUNK_SIZE):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _store_object(store: Path, path: Path, digest: str) -> int:
+    """Compress `path` into the object store. Returns compressed bytes written (0 if present)."""
+    dest = _object_path(store, digest)
+    if dest.exists():
+        return 0
+    dest.parent.mkdir(parents=True, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=dest.parent, suffix=".tmp")
+    try:
+        with path.open("rb") as src, os.fdopen(fd, "wb") as raw:
+            with gzip.GzipFile(fileobj=raw, mode="wb", compresslevel=COMPRESS_LEVEL, mtime=0) as gz:
+                shutil.copyfileobj(src, gz, CHUNK_SIZE)
+        os.replace(tmp, dest)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+    return dest.stat().st_size
+
+
+def _snapshots(store: Path) -> list[Path]:
+    snap_dir = store / "snapshots"
+    if not snap_dir.exists():
+        return []
+    return sorted(p for p in snap_dir.iterdir() if (p / "manifest.json").exists())
+
+
+def _walk_data(data_dir: Path):
+    for root, dirs, files in os.walk(data_dir):
+        dirs.sort()
+        for name in sorted(files):
+            if any(fnmatch.fnmatch(name, pattern) for pattern in EXCLUDE):
+                continue
+            path = Path(root) / name
+            yield path.relative_to(data_dir).as_posix(), path
+
+
+def _copy_database(db_path: Path, dest: Path) -> None:
+    """Online copy of a live SQLite database."""
+    src = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True, timeout=30)
+    dst = sqlite3.connect(dest)
+    try:
+        src.backup(dst, pages=1024, sleep=0.01)
+    finally:
+        dst.close()
+        src.close()
+
+
+def cmd_backup(args) -> None:
+    """Take an incremental snapshot of data/."""
+    data_dir = DATA_DIR
+    store = Path(getattr(args, "dest", None) or BACKUP_DIR)
+    if not data_dir.exists():
+        print(f"ERROR: {data_dir} does not exist.", file=sys.stderr)
+        sys.exit(1)
+    if uses_postgres(data_dir):
+        print(f"ERROR: {POSTGRES_HINT}", file=sys.stderr)
+        sys.exit(1)
+
+    started = time.time()
+    previous = _snapshots(store)
+    prev_files = {}
+    if previous:
+        prev_files = json.loads((previous[-1] / "manifest.json").read_text())["files"]
+        print(f"Previous snapshot: {previous[-1].name}")
+
+    files: dict = {}
+    to_hash: list[tuple[str, Path, os.stat_result]] = []
+    for rel, path in _walk_data(data_dir):
+        st = path.stat()
+        prev = prev_files.get(rel)
+        if (
+            prev
+            and prev["size"] == st.st_size
+            and prev["mtime_ns"] == st.st_mtime_ns
+            and _object_path(store, prev["sha256"]).exists()
+        ):
+            files[rel] = prev
+        else:
+            to_hash.append((rel, path, st))
+
+    print(f"Files: {len(files) + len(to_hash)} ({len(files)} unchanged, {len(to_hash)} new or modified)")
+
+    def store_one(item: tuple[str, Path, os.stat_result]) -> tuple[str, dict, int]:
+        rel, path, st = item
+        digest = hash_file(path)
+        written = _store_object(store, path, digest)
+        entry = {"sha256": digest, "size": st.st_size, "mtime_ns": st.st_mtime_ns, "mode": st.st_mode & 0o777}
+        return rel, entry, written
+
+    written_total = 0
+    with ThreadPoolExecutor(max_workers=WORKERS) as pool:
+        for rel, entry, written in pool.map(store_one, to_hash):
+            files[rel] = entry
+            written_total += written
+
+    db_path = data_dir / DB_NAME
+    if db_path.exists():
+        print(f"Copying {DB_NAME} with the SQLite online backup API...")
+        store.mkdir(parents=True, exist_ok=True)
+        with tempfile.TemporaryDirectory(dir=store) as tmp:
+            db_copy = Path(tmp) / DB_NAME
+            _copy_database(db_path, db_copy)
+            _, entry, written = store_one((DB_NAME, db_copy, db_copy.stat()))
+            entry["mode"] = db_path.stat().st_mode & 0o777
+            files[DB_NAME] = entry
+            written_total += written
+
+    base = datetime.now().strftime("%Y%m%d-%H%M%S")
+    (store / "snapshots").mkdir(parents=True, exist_ok=True)
+    for n in range(1, 100):
+        name = base if n == 1 else f"{base}-{n}"
+        snap = store / "snapshots" / name
+        try:
+            snap.mkdir()
+            break
+        except FileExistsError:
+            continue
+    else:
+        print(f"ERROR: too many snapshots named {base}*", file=sys.stderr)
+        sys.exit(1)
+    manifest = {"created": datetime.now().isoformat(timespec="seconds"), "files": files}
+    (snap / "manifest.json").write_text(json.dumps(manifest, indent=1) + "\n")
+
+    total = sum(e["size"] for e in files.values())
+    print(f"Snapshot {name}: {len(files)} files, {total / 1024 ** 2:.1f} MiB")
+    print(f"  New data stored: {written_total / 1024 ** 2:.1f} MiB compressed")
+    print(f"  Took {time.time() - started:.1f}s")
+    print(f"  Store: {store}")
+
+
+def _restore_one(store: Path, target: Path | None, rel: str, entry: dict) -> str | None:
+    """Decompress one object, verifying its hash. Returns an error message or None."""
+    obj = _object_path(store, entry["sha256"])
+    if not obj.exists():
+        return f"{rel}: missing object {entry['sha256'][:12]}"
+
+    h = hashlib.sha256()
+    out = None
+    tmp = None
+    if target is not None:
+        dest = target / rel
+        dest.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=dest.parent, suffix=".restore")
+        out = os.fdopen(fd, "wb")
+    try:
+        with gzip.open(obj, "rb") as gz:
+            while chunk := gz.read(CHUNK_SIZE):
+                h.update(chunk)
+                if out:
+                    out.write(chunk)
+    except (OSError, EOFError) as e:
+        if out:
+            out.close()
+            os.unlink(tmp)
+        return f"{rel}: corrupt object ({e})"
+
+    if out:
+        out.close()
+    if h.hexdigest() != entry["sha256"]:
+        if tmp:
+            os.unlink(tmp)
+        return f"{rel}: checksum mismatch"
+    if tmp:
+        os.chmod(tmp, entry.get("mode", 0o644))
+        if rel == DB_NAME:
+            # Only once the copy verified: a leftover WAL would be replayed
+            # onto the restored database, but belongs to the old one until then.
+            for suffix in ("-wal", "-shm"):
+                (target / (DB_NAME + suffix)).unlink(missing_ok=True)
+        os.replace(tmp, target / rel)
+        os.utime(target / rel, ns=(entry["mtime_ns"], entry["mtime_ns"]))
+    return None
+
+
+def _synapse_running() -> bool:
+    """Whether the synapse container is up, via the Docker API or CLI (False without Docker)."""
+    from manage import docker_api
+
+    client = docker_api.get_client()
+    if client is not None:
+        try:
+            return any(
+                c.get("Labels", {}).get("com.docker.compose.service") == "synapse" and c.get("State") == "running"
+                for c in client.containers()
+            )
+        except OSError:
+            pass
+    try:
+        result = subprocess.run(
+            ["docker", "compose", "ps", "-q", "--status", "running", "synapse"],
+            cwd=REPO_ROOT, capture_output=True, text=True,
+        )
+    except FileNotFoundError:
+        return False
+    return bool(result.stdout.strip())
+
+
+def cmd_restore(args) -> None:
+    """Verify a snapshot and restore it into data/ (or --target)."""
+    store = Path(getattr(args, "source", None) or BACKUP_DIR)
+    snapshots = _snapshots(store)
+    if not snapshots:
+        print(f"No snapshots found in {store}", file=sys.stderr)
+        sys.exit(1)
+
+    wanted = getattr(args, "snapshot", None)
+    if wanted:
+        matches = [s for s in snapshots if s.name == wanted]
+        if not matches:
+            print(f"Unknown snapshot: {wanted}. Available:", file=sys.stderr)
+            for s in snapshots:
+                print(f"  {s.name}", file=sys.stderr)
+            sys.exit(1)
+        snap = matches[0]
+    else:
+        snap = snapshots[-1]
+
+    check_only = getattr(args, "check", False)
+    target = None if check_only else Path(getattr(args, "target", None) or DATA_DIR)
+    if target is not None and uses_postgres(target):
+        print(f"ERROR: {POSTGRES_HINT}\nRestoring would bring back the SQLite configuration.", file=sys.stderr)
+        sys.exit(1)
+    if target is not None and (target / DB_NAME).exists():
+        if not getattr(args, "force", False):
+            print(f"ERROR: {target / DB_NAME} exists. Stop Synapse and pass --force to overwrite.", file=sys.stderr)
+            sys.exit(1)
+        if target.resolve() == DATA_DIR.resolve() and _synapse_running():
+            print("ERROR: Synapse is running. Stop it first: docker compose stop synapse", file=sys.stderr)
+            sys.exit(1)
+
+    files = json.loads((snap / "manifest.json").read_text())["files"]
+    action = "Verifying" if check_only else f"Restoring into {target}"
+    print(f"{action}: snapshot {snap.name} ({len(files)} files)")
+
+    started = time.time()
+    with ThreadPoolExecutor(max_workers=WORKERS) as pool:
+        errors = [
+            err for err in pool.map(lambda item: _restore_one(store, target, *item), files.items())
+            if err
+        ]
+
+    for err in errors:
+        print(f"  ERROR {err}", file=sys.stderr)
+    print(f"  {len(files) - len(errors)}/{len(files)} files OK in {time.time() - started:.1f}s")
+    if errors:
+        sys.exit(1)
@@ -0,0 +1,249 @@
+"""Tunnel benchmark — localhost vs the Cloudflare tunnel, small and large requests.
+
+Each phase runs `--concurrency` keep-alive clients for `--duration` seconds
+against one target: small requests hit /_matrix/client/versions, large ones
+download a test upload through the authenticated media API. Results are
+appended to runtime/bench-history.jsonl together with the tunnel's age, so
+a tunnel that degrades over its lifetime shows up in the history.
+
+Every request carries `?nocache=1`, which makes the router skip its media
+and /versions cache (router/media-cache.conf) without storing anything.
+Both targets therefore end at Synapse, and the difference between the
+columns is the tunnel (plus the router hop) rather than cache hits.
+"""
+
+import http.client
+import json
+import os
+import sys
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import datetime, timezone
+from pathlib import Path
+
+from manage import docker_api, trace
+from manage.stats import fmt_seconds, percentile
+from manage.tokens import SynapseError, load_config, synapse_request
+
+BENCH_HISTORY_FILE = Path(__file__).parent.parent / "runtime" / "bench-history.jsonl"
+LOCAL_URL = "http://localhost:8008"
+REQUEST_TIMEOUT = 30
+HISTORY_ROWS = 5
+NO_CACHE = "nocache=1"  # honoured by the router, ignored by Synapse
+
+
+class _Fetcher:
+    """One keep-alive connection; GETs a path and returns (status, bytes read)."""
+
+    def __init__(self, base_url: str, token: str | None):
+        parsed = urllib.parse.urlparse(base_url)
+        cls = http.client.HTTPSConnection if parsed.scheme == "https" else http.client.HTTPConnection
+        self.conn = cls(parsed.netloc, timeout=REQUEST_TIMEOUT)
+        self.prefix = parsed.path.rstrip("/")
+        self.headers = {"User-Agent": "manage.py-bench/1.0"}
+        if token:
+            self.headers["Authorization"] = f"Bearer {token}"
+
+    def get(self, path: str) -> tuple[int, int]:
+        try:
+            self.conn.request("GET", self.prefix + path, headers=self.headers)
+            resp = self.conn.getresponse()
+            size = 0
+            while chunk := resp.read(65536):
+                size += len(chunk)
+            return resp.status, size
+        except (http.client.HTTPException, OSError):
+            self.conn.close()  # reconnects on the next request
+            return 0, 0
+
+
+def run_phase(base_url: str, path: str, concurrency: int, duration: float, token: str | None = None) -> dict:
+    """Hammer `base_url + path` from `concurrency` threads; returns summary stats."""
+    latencies: list[float] = []
+    errors = 0
+    total_bytes = 0
+    lock = threading.Lock()
+    deadline = time.monotonic() + duration
+
+    def worker() -> None:
+        nonlocal errors, total_bytes
+        fetcher = _Fetcher(base_url, token)
+        while time.monotonic() < deadline:
+            start = time.monotonic()
+            status, size = fetcher.get(path)
+            elapsed = time.monotonic() - start
+            with lock:
+                if status == 200:
+                    latencies.append(elapsed)
+                    total_bytes += size
+                else:
+                    errors += 1
+        fetcher.conn.close()
+
+    started = time.monotonic()
+    with trace.span(f"bench {base_url}{path.split('?')[0]}", "http"):
+        threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+    elapsed = time.monotonic() - started
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50": percentile(latencies, 50),
+        "p95": percentile(latencies, 95),
+        "p99": percentile(latencies, 99),
+        "mbps": round(total_bytes / elapsed / 1e6, 2),
+    }
+
+
+def _upload_media(config: dict, size_mb: float) -> str:
+    """Upload `size_mb` of random bytes; returns the mxc:// URI."""
+    url = config["server_url"].rstrip("/") + "/_matrix/media/v3/upload?filename=bench.bin"
+    req = urllib.request.Request(
+        url,
+        data=os.urandom(int(size_mb * 1e6)),
+        headers={
+            "Authorization": f"Bearer {config['access_token']}",
+            "Content-Type": "application/octet-stream",
+        },
+        method="POST",
+    )
+    try:
+        with trace.span("upload bench media", "http"), urllib.request.urlopen(req, timeout=60) as resp:
+            return json.loads(resp.read())["content_uri"]
+    except urllib.error.HTTPError as e:
+        print(f"ERROR: media upload returned {e.code}: {e.read().decode()[:200]}", file=sys.stderr)
+        sys.exit(1)
+    except OSError as e:
+        print(f"ERROR: could not reach {config['server_url']}: {e}", file=sys.stderr)
+        sys.exit(1)
+
+
+def _tunnel_age() -> float | None:
+    """Seconds since the cloudflared container started, if Docker says."""
+    client = docker_api.get_client()
+    if client is None:
+        return None
+    try:
+        container_id = client.container_id("cloudflared")
+        if container_id is None:
+            return None
+        started = client.inspect(container_id).get("State", {}).get("StartedAt", "")
+    except OSError:
+        return None
+    # Docker reports nanoseconds; fromisoformat takes at most microseconds.
+    started = started.split(".")[0].rstrip("Z")
+    try:
+        dt = datetime.fromisoformat(started).replace(tzinfo=timezone.utc)
+    except ValueError:
+        return None
+    return max(0.0, time.time() - dt.timestamp())
+
+
+def _fmt_age(seconds: float | None) -> str:
+    if seconds is None:
+        return "-"
+    if seconds < 3600:
+        return f"{seconds / 60:.0f}m"
+    if seconds < 86400:
+        return f"{seconds / 3600:.1f}h"
+    return f"{seconds / 86400:.1f}d"
+
+
+def _print_results(results: dict[str, dict[str, dict]]) -> None:
+    targets = list(results)
+    print(f"{'':<22}" + "".join(f"{t:>14}" for t in targets))
+    for kind in ("small", "large"):
+        print(f"{kind} ({'/versions' if kind == 'small' else 'media'})")
+        rows = [
+            ("requests", lambda r: str(r["requests"])),
+            ("errors", lambda r: str(r["errors"])),
+            ("RPS", lambda r: f"{r['rps']:.1f}"),
+            ("p50", lambda r: fmt_seconds(r["p50"])),
+            ("p95", lambda r: fmt_seconds(r["p95"])),
+            ("p99", lambda r: fmt_seconds(r["p99"])),
+            ("MB/s", lambda r: f"{r['mbps']:.2f}"),
+        ]
+        for label, fmt in rows:
+            print(f"  {label:<20}" + "".join(f"{fmt(results[t][kind]):>14}" for t in targets))
+
+
+def _record(entry: dict) -> None:
+    """Append to the history and print recent tunnel runs for comparison."""
+    BENCH_HISTORY_FILE.parent.mkdir(parents=True, exist_ok=True)
+    with BENCH_HISTORY_FILE.open("a") as f:
+        f.write(json.dumps(entry) + "\n")
+
+    history = []
+    for line in BENCH_HISTORY_FILE.read_text().splitlines():
+        try:
+            past = json.loads(line)
+        except json.JSONDecodeError:
+            continue
+        if "tunnel" in past.get("results", {}):
+            history.append(past)
+    if not history:
+        return
+
+    print()
+    print(f"Tunnel history (last {min(len(history), HISTORY_ROWS)} of {len(history)} runs, {BENCH_HISTORY_FILE.name}):")
+    print(f"  {'AT':<20} {'AGE':>6} {'SMALL P50':>10} {'SMALL RPS':>10} {'LARGE P50':>10} {'MB/S':>8}")
+    for past in history[-HISTORY_ROWS:]:
+        small, large = past["results"]["tunnel"]["small"], past["results"]["tunnel"]["large"]
+        print(
+            f"  {past['at']:<20} {_fmt_age(past.get('tunnel_age')):>6} {fmt_seconds(small['p50']):>10} "
+            f"{small['rps']:>10.1f} {fmt_seconds(large['p50']):>10} {large['mbps']:>8.2f}"
+        )
+
+
+def cmd_bench(args) -> None:
+    """Benchmark localhost and the tunnel side by side."""
+    from manage.status import get_tunnel_url
+
+    config = load_config()
+    targets = {"localhost": args.local or LOCAL_URL}
+    tunnel_url = get_tunnel_url()
+    if tunnel_url:
+        targets["tunnel"] = tunnel_url
+    else:
+        print("WARNING: No tunnel URL in runtime/tunnel-url; benchmarking localhost only", file=sys.stderr)
+
+    print(f"Uploading a {args.size:g} MB test file...")
+    mxc = _upload_media(config, args.size)
+    server_name, media_id = mxc[len("mxc://"):].split("/", 1)
+    media_path = f"/_matrix/client/v1/media/download/{server_name}/{media_id}"
+
+    phases = {
+        "small": (f"/_matrix/client/versions?{NO_CACHE}", None),
+        "large": (f"{media_path}?{NO_CACHE}", config["access_token"]),
+    }
+    results: dict[str, dict[str, dict]] = {}
+    try:
+        for name, base in targets.items():
+            results[name] = {}
+            for kind, (path, token) in phases.items():
+                print(f"  {name} {kind}: {args.concurrency} clients for {args.duration}s against {base}")
+                results[name][kind] = run_phase(base, path, args.concurrency, args.duration, token)
+    finally:
+        try:
+            synapse_request("DELETE", f"/_synapse/admin/v1/media/{server_name}/{media_id}", config, raise_errors=True)
+        except (SynapseError, OSError) as e:
+            print(f"WARNING: could not delete test media {mxc}: {e}", file=sys.stderr)
+
+    print()
+    _print_results(results)
+    _record({
+        "at": datetime.now().isoformat(timespec="seconds"),
+        "tunnel_url": tunnel_url,
+        "tunnel_age": _tunnel_age() if tunnel_url else None,
+        "concurrency": args.concurrency,
+        "duration": args.duration,
+        "size_mb": args.size,
+        "results": results,
+    })
@@ -1,35 +1,47 @@
 """Compose helpers: up, down, env injection, tunnel URL waiting."""
 
+import http.client
 import os
 import re
 import subprocess
 import sys
 import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from manage import docker_api, trace
 
 TUNNEL_WAIT_SECONDS = 120
 TUNNEL_POLL_INTERVAL = 2
 TUNNEL_URL_PATTERN = re.compile(r"https://[a-zA-Z0-9-]+\.trycloudflare\.com")
+TUNNEL_URL_FILE = Path(__file__).parent.parent / "runtime" / "tunnel-url"
+# Everything but tunnel-watcher, via depends_on; starts before credentials are known.
+PRE_AUTH_SERVICES = ["element", "cloudflared"]
+FAST_PATH_TIMEOUT = 1
+GITHUB_ENV_KEYS = ("GITHUB_TOKEN", "GITHUB_REPO", "NODE_NAME")
 
 
 def _run(args: list[str], **kwargs) -> subprocess.CompletedProcess:
-    return subprocess.run(args, **kwargs)
+    with trace.span(trace.command_label(args), "subprocess"):
+        return subprocess.run(args, **kwargs)
 
 
 def get_github_env() -> dict[str, str]:
     """Return GITHUB_TOKEN, GITHUB_REPO, NODE_NAME by running gh CLI."""
-    token_result = _run(
-        ["gh", "auth", "token"],
-        capture_output=True, text=True,
-    )
+    with ThreadPoolExecutor(max_workers=2) as pool:
+        token_future = pool.submit(_run, ["gh", "auth", "token"], capture_output=True, text=True)
+        repo_future = pool.submit(
+            _run, ["gh", "repo", "view", "--json", "nameWithOwner", "-q", ".nameWithOwner"],
+            capture_output=True, text=True,
+        )
+        token_result, repo_result = token_future.result(), repo_future.result()
+
     if token_result.returncode != 0:
         print("ERROR: `gh auth token` failed. Are you authenticated with `gh auth login`?", file=sys.stderr)
         sys.exit(1)
     token = token_result.stdout.strip()
 
-    repo_result = _run(
-        ["gh", "repo", "view", "--json", "nameWithOwner", "-q", ".nameWithOwner"],
-        capture_output=True, text=True,
-    )
     if repo_result.returncode != 0:
         print("ERROR: `gh repo view` failed. Are you in a GitHub-backed git repo?", file=sys.stderr)
         sys.exit(1)
@@ -43,21 +55,138 @@ def get_github_env() -> dict[str, str]:
     }
 
 
-def cmd_up(args) -> None:
-    """Start services, wait for tunnel URL, print status."""
-    print("Fetching GitHub credentials...")
-    extra_env = get_github_env()
-    print(f"  Repo: {extra_env['GITHUB_REPO']}")
-    print(f"  Node: {extra_env['NODE_NAME']}")
+def _config_hashes(env: dict[str, str]) -> dict[str, str] | None:
+    """{service: config hash} for the current compose files and .env."""
+    result = _run(["docker", "compose", "config", "--hash", "*"], capture_output=True, text=True, env=env)
+    if result.returncode != 0:
+        return None
+    hashes = {}
+    for line in result.stdout.splitlines():
+        service, _, digest = line.strip().partition(" ")
+        if service:
+            hashes[service] = digest.strip()
+    return hashes
+
+
+def _containers_current(client: docker_api.DockerClient) -> bool:
+    """Every configured service runs, healthy, with the config it would get from `up` now.
+
+    Compares `docker compose config --hash` with the config-hash label compose
+    put on each container, so edits to the compose files, the override or
+    .env take the slow path. tunnel-watcher's hash covers the GitHub
+    variables, so the values it is running with are reused rather than
+    asking gh.
+    """
+    containers = client.containers()
+    by_service: dict[str, list[dict]] = {}
+    for c in containers:
+        by_service.setdefault(c.get("Labels", {}).get("com.docker.compose.service"), []).append(c)
+    # Status reads e.g. "Up 3 hours (healthy)" or "Up 5 seconds (health: starting)".
+    if not containers or not all(
+        c.get("State") == "running" and not re.search(r"unhealthy|starting", c.get("Status", ""))
+        for c in containers
+    ):
+        return False
+    watcher = by_service.get("tunnel-watcher")
+    if not watcher:
+        return False
+    running_env = dict(
+        item.partition("=")[::2] for item in client.inspect(watcher[0]["Id"]).get("Config", {}).get("Env") or []
+    )
+    env = {**os.environ, **{key: running_env.get(key, "") for key in GITHUB_ENV_KEYS}}
+    hashes = _config_hashes(env)
+    if not hashes:
+        return False
+    return all(
+        any(c.get("Labels", {}).get("com.docker.compose.config-hash") == digest for c in by_service.get(service, []))
+        for service, digest in hashes.items()
+    )
+
+
+def _live_tunnel_url(client: docker_api.DockerClient) -> str | None:
+    """The tunnel URL cloudflared last logged, if it answers /versions right now."""
+    container_id = client.container_id("cloudflared")
+    if container_id is None:
+        return None
+    urls = TUNNEL_URL_PATTERN.findall(client.logs(container_id, tail=100))
+    if not urls:
+        return None
+    req = urllib.request.Request(f"{urls[-1]}/_matrix/client/versions", headers={"User-Agent": "manage.py/1.0"})
+    try:
+        with urllib.request.urlopen(req, timeout=FAST_PATH_TIMEOUT) as resp:
+            return urls[-1] if resp.status == 200 else None
+    except OSError:
+        return None
+
+
+@trace.traced("check running stack")
+def _running_stack_url() -> str | None:
+    """The live tunnel URL if the whole stack is already up to date and healthy, else None.
+
+    Container state and the tunnel check run in parallel; needs the
+    Docker API (the CLI is too slow for a fast path). Any error here just
+    means taking the slow path.
+    """
+    try:
+        client = docker_api.get_client()
+        if client is None:
+            return None
+        with ThreadPoolExecutor(max_workers=2) as pool:
+            current = pool.submit(_containers_current, client)
+            url = pool.submit(_live_tunnel_url, client)
+            return url.result() if current.result() else None
+    except (OSError, http.client.HTTPException, ValueError):
+        return None
+
+
+def _save_tunnel_url(url: str) -> None:
+    """Record the URL in runtime/tunnel-url for status, tunnel and bench."""
+    TUNNEL_URL_FILE.parent.mkdir(parents=True, exist_ok=True)
+    TUNNEL_URL_FILE.write_text(url + "\n")
+
+
+def _print_summary(url: str) -> None:
+    print()
+    print(f"  Synapse:  http://localhost:8008")
+    print(f"  Element:  http://localhost:8080")
+    print(f"  Tunnel:   {url}")
+    print()
+    print("tunnel-watcher is running and will re-publish if the URL changes.")
 
-    env = {**os.environ, **extra_env}
 
-    print("Starting services...")
-    result = _run(["docker", "compose", "up", "-d"], env=env)
+def _compose_up(services: list[str], env: dict[str, str]) -> None:
+    result = _run(["docker", "compose", "up", "-d", *services], env=env)
     if result.returncode != 0:
         print("ERROR: docker compose up failed", file=sys.stderr)
         sys.exit(result.returncode)
 
+
+def cmd_up(args) -> None:
+    """Start services, wait for tunnel URL, print status.
+
+    Returns straight away if every service is running with its current
+    config and the tunnel answers. Otherwise the gh credential lookup runs while the services
+    that don't need credentials start; tunnel-watcher starts once it's done.
+    """
+    url = _running_stack_url()
+    if url:
+        print("All services are running and the tunnel is live.")
+        _save_tunnel_url(url)
+        _print_summary(url)
+        return
+
+    print("Starting services (fetching GitHub credentials in parallel)...")
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        github_env = pool.submit(get_github_env)
+        # Blank placeholders keep compose from warning about unset variables;
+        # tunnel-watcher, the only service using them, isn't started yet.
+        _compose_up(PRE_AUTH_SERVICES, {**{key: "" for key in GITHUB_ENV_KEYS}, **os.environ})
+        extra_env = github_env.result()
+    print(f"  Repo: {extra_env['GITHUB_REPO']}")
+    print(f"  Node: {extra_env['NODE_NAME']}")
+
+    _compose_up([], {**os.environ, **extra_env})
+
     print(f"Waiting for tunnel URL (up to {TUNNEL_WAIT_SECONDS}s)...")
     url = _wait_for_tunnel_url()
 
@@ -69,12 +198,8 @@ def cmd_up(args) -> None:
         )
         sys.exit(1)
 
-    print()
-    print(f"  Synapse:  http://localhost:8008")
-    print(f"  Element:  http://localhost:8080")
-    print(f"  Tunnel:   {url}")
-    print()
-    print("tunnel-watcher is running and will re-publish if the URL changes.")
+    _save_tunnel_url(url)
+    _print_summary(url)
 
 
 def cmd_down(args) -> None:
@@ -83,18 +208,32 @@ def cmd_down(args) -> None:
     sys.exit(result.returncode)
 
 
+@trace.traced("wait for tunnel URL")
 def _wait_for_tunnel_url() -> str | None:
     """Poll cloudflared container logs until a tunnel URL appears or timeout."""
     deadline = time.time() + TUNNEL_WAIT_SECONDS
+    client = docker_api.get_client()
+    container_id = None
     attempt = 0
     while time.time() < deadline:
         attempt += 1
-        result = _run(
-            ["docker", "compose", "logs", "cloudflared", "--tail", "100"],
-            capture_output=True, text=True,
-        )
-        if result.returncode == 0:
-            urls = TUNNEL_URL_PATTERN.findall(result.stdout + result.stderr)
+        output = None
+        if client is not None:
+            try:
+                container_id = container_id or client.container_id("cloudflared")
+                if container_id:
+                    output = client.logs(container_id, tail=100)
+            except OSError:
+                client = None
+        if client is None:
+            result = _run(
+                ["docker", "compose", "logs", "cloudflared", "--tail", "100"],
+                capture_output=True, text=True,
+            )
+            if result.returncode == 0:
+                output = result.stdout + result.stderr
+        if output:
+            urls = TUNNEL_URL_PATTERN.findall(output)
             if urls:
                 return urls[-1]
         print(f"  attempt {attempt}...")
@@ -0,0 +1,167 @@
+"""SQLite database stats and maintenance for data/homeserver.db."""
+
+import sqlite3
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from manage import trace
+from manage.backup import DATA_DIR, DB_NAME, POSTGRES_HINT, uses_postgres
+
+STATE_TABLES = ["state_groups_state", "state_groups", "state_group_edges", "current_state_events"]
+SAMPLE_QUERY = (
+    "SELECT event_id FROM events"
+    " WHERE room_id = (SELECT room_id FROM events ORDER BY stream_ordering DESC LIMIT 1)"
+    " ORDER BY stream_ordering DESC LIMIT 50"
+)
+
+
+def _run(args: list[str], **kwargs) -> subprocess.CompletedProcess:
+    with trace.span(trace.command_label(args), "subprocess"):
+        return subprocess.run(args, **kwargs)
+
+
+def _db_path(args) -> Path:
+    if not getattr(args, "db", None) and uses_postgres():
+        print(f"ERROR: {POSTGRES_HINT}", file=sys.stderr)
+        sys.exit(1)
+    path = Path(getattr(args, "db", None) or DATA_DIR / DB_NAME)
+    if not path.exists():
+        print(f"ERROR: {path} not found.", file=sys.stderr)
+        sys.exit(1)
+    return path
+
+
+def _mib(n: float) -> str:
+    return f"{n / 1024 ** 2:,.1f} MiB"
+
+
+def _on_disk(path: Path) -> int:
+    """Database file plus its WAL, in bytes."""
+    wal = path.with_name(path.name + "-wal")
+    return path.stat().st_size + (wal.stat().st_size if wal.exists() else 0)
+
+
+def _time_query(conn: sqlite3.Connection, query: str, repeat: int = 5) -> float:
+    """Best-of-N wall time for `query`, in seconds."""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        conn.execute(query).fetchall()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def _db_stats(args) -> None:
+    path = _db_path(args)
+    top = getattr(args, "top", 15)
+    conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+
+    page_size = conn.execute("PRAGMA page_size").fetchone()[0]
+    page_count = conn.execute("PRAGMA page_count").fetchone()[0]
+    free_pages = conn.execute("PRAGMA freelist_count").fetchone()[0]
+    auto_vacuum = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+    print(f"Database: {path}")
+    print(f"  On disk:    {_mib(_on_disk(path))} (incl. WAL)")
+    print(f"  Pages:      {page_count} x {page_size} bytes")
+    print(f"  Free pages: {free_pages} ({free_pages / page_count * 100 if page_count else 0:.1f}%, "
+          f"{_mib(free_pages * page_size)} reclaimable)")
+    print(f"  auto_vacuum: {['none', 'full', 'incremental'][auto_vacuum]}")
+
+    owners = {
+        name: (kind, table)
+        for kind, name, table in conn.execute("SELECT type, name, tbl_name FROM sqlite_master")
+    }
+    try:
+        sizes = conn.execute(
+            "SELECT name, SUM(pgsize) FROM dbstat GROUP BY name ORDER BY 2 DESC"
+        ).fetchall()
+    except sqlite3.OperationalError:
+        print("\n  (this sqlite3 build has no dbstat table; per-table sizes unavailable)")
+        sizes = []
+
+    if sizes:
+        print("\n--- Largest tables and indexes ---")
+        print(f"{'NAME':<50} {'KIND':<6} {'SIZE':>14}")
+        for name, size in sizes[:top]:
+            kind, _ = owners.get(name, ("table", name))
+            print(f"{name[:50]:<50} {kind:<6} {_mib(size):>14}")
+
+        per_table: dict = {}
+        for name, size in sizes:
+            _, table = owners.get(name, ("table", name))
+            per_table[table] = per_table.get(table, 0) + size
+        print("\n--- State-group tables (table + indexes) ---")
+        for table in STATE_TABLES:
+            if table in per_table:
+                rows = conn.execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+                print(f"  {table:<28} {rows:>12} rows  {_mib(per_table[table]):>14}")
+    conn.close()
+
+
+def _db_maintain(args) -> None:
+    path = _db_path(args)
+    query = getattr(args, "query", None) or SAMPLE_QUERY
+
+    print("Stopping synapse...")
+    result = _run(["docker", "compose", "stop", "synapse"])
+    if result.returncode != 0:
+        print("ERROR: docker compose stop synapse failed", file=sys.stderr)
+        sys.exit(result.returncode)
+
+    step = "open database"
+    conn = None
+    error = None
+    try:
+        size_before = _on_disk(path)
+        conn = sqlite3.connect(path, isolation_level=None)
+        step = "sample query"
+        sample_before = _time_query(conn, query)
+
+        step = "read auto_vacuum"
+        steps = [("ANALYZE", "ANALYZE")]
+        auto_vacuum = conn.execute("PRAGMA auto_vacuum").fetchone()[0]
+        if auto_vacuum == 2:
+            steps.append(("incremental vacuum", "PRAGMA incremental_vacuum"))
+        elif getattr(args, "full", False):
+            steps.append(("switch to incremental auto_vacuum", "PRAGMA auto_vacuum = INCREMENTAL"))
+            steps.append(("VACUUM", "VACUUM"))
+        else:
+            print("  auto_vacuum is off; skipping vacuum (use --full once to VACUUM and enable incremental)")
+        steps.append(("WAL checkpoint", "PRAGMA wal_checkpoint(TRUNCATE)"))
+
+        for step, sql in steps:
+            start = time.perf_counter()
+            conn.execute(sql).fetchall()
+            print(f"  {step}: {time.perf_counter() - start:.1f}s")
+
+        step = "sample query"
+        sample_after = _time_query(conn, query)
+        size_after = _on_disk(path)
+    except sqlite3.Error as e:
+        error = e
+    finally:
+        if conn is not None:
+            conn.close()
+        print("Starting synapse...")
+        _run(["docker", "compose", "start", "synapse"])
+
+    if error is not None:
+        print(f"ERROR: {step} failed on {path}: {error}", file=sys.stderr)
+        sys.exit(1)
+
+    print(f"\nReclaimed:    {_mib(size_before - size_after)} ({_mib(size_before)} -> {_mib(size_after)})")
+    print(f"Sample query: {sample_before * 1000:.2f}ms -> {sample_after * 1000:.2f}ms")
+
+
+def cmd_db(args) -> None:
+    """Dispatch db subcommands."""
+    dispatch = {
+        "stats": _db_stats,
+        "maintain": _db_maintain,
+    }
+    if args.db_cmd not in dispatch:
+        print(f"Unknown db subcommand: {args.db_cmd}", file=sys.stderr)
+        sys.exit(1)
+    dispatch[args.db_cmd](args)
@@ -0,0 +1,184 @@
+"""Minimal Docker Engine API client over the local unix socket.
+
+Talks HTTP to /var/run/docker.sock (or DOCKER_HOST=unix://...) on
+keep-alive connections, one per thread, instead of spawning a
+`docker compose` CLI per query. Callers fall back to the CLI when
+`get_client()` returns None (no socket, no permission, remote DOCKER_HOST).
+"""
+
+import http.client
+import json
+import os
+import re
+import socket
+import struct
+import threading
+import urllib.parse
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from manage import trace
+
+DEFAULT_SOCKET = "/var/run/docker.sock"
+REPO_ROOT = Path(__file__).parent.parent
+
+
+class _UnixConnection(http.client.HTTPConnection):
+    def __init__(self, socket_path: str, timeout: float = 10):
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = socket_path
+
+    def connect(self) -> None:
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        sock.connect(self.socket_path)
+        self.sock = sock
+
+
+def _demux(raw: bytes) -> str:
+    """Strip Docker's 8-byte stream headers from non-TTY log output."""
+    if len(raw) < 8 or raw[0] not in (0, 1, 2) or raw[1:4] != b"\0\0\0":
+        return raw.decode("utf-8", errors="replace")
+    out = []
+    i = 0
+    while i + 8 <= len(raw):
+        size = struct.unpack(">I", raw[i + 4:i + 8])[0]
+        out.append(raw[i + 8:i + 8 + size])
+        i += 8 + size
+    return b"".join(out).decode("utf-8", errors="replace")
+
+
+def compose_project() -> str:
+    """The compose project name docker compose uses for this checkout."""
+    name = os.environ.get("COMPOSE_PROJECT_NAME") or REPO_ROOT.resolve().name
+    return re.sub(r"[^a-z0-9_-]", "", name.lower())
+
+
+class DockerClient:
+    def __init__(self, socket_path: str, project: str):
+        self.socket_path = socket_path
+        self.project = project
+        self.local = threading.local()
+
+    def _get(self, path: str, params: dict | None = None) -> bytes:
+        if params:
+            path = f"{path}?{urllib.parse.urlencode(params)}"
+        for attempt in (1, 2):
+            conn = getattr(self.local, "conn", None)
+            if conn is None:
+                conn = self.local.conn = _UnixConnection(self.socket_path)
+            try:
+                with trace.span(f"docker GET {path.split('?')[0]}", "docker"):
+                    conn.request("GET", path)
+                    resp = conn.getresponse()
+                    body = resp.read()
+            except (http.client.HTTPException, OSError) as e:
+                conn.close()
+                self.local.conn = None
+                if attempt == 2:
+                    # Callers fall back to the CLI on OSError; HTTPException isn't one.
+                    raise OSError(f"Docker API GET {path.split('?')[0]} failed: {e!r}") from e
+                continue
+            if resp.status >= 400:
+                raise OSError(f"Docker API {resp.status} for {path}: {body[:200]!r}")
+            return body
+        raise AssertionError("unreachable")
+
+    def _json(self, path: str, params: dict | None = None):
+        body = self._get(path, params)
+        try:
+            return json.loads(body)
+        except ValueError as e:
+            raise OSError(f"Docker API returned invalid JSON for {path}: {body[:200]!r}") from e
+
+    def ping(self) -> bool:
+        return self._get("/_ping") == b"OK"
+
+    def containers(self) -> list[dict]:
+        """All containers (running or not) in this compose project."""
+        filters = json.dumps({"label": [f"com.docker.compose.project={self.project}"]})
+        return self._json("/containers/json", {"all": "1", "filters": filters})
+
+    def container_id(self, service: str) -> str | None:
+        for c in self.containers():
+            if c.get("Labels", {}).get("com.docker.compose.service") == service:
+                return c["Id"]
+        return None
+
+    def inspect(self, container_id: str) -> dict:
+        return self._json(f"/containers/{container_id}/json")
+
+    def logs(self, container_id: str, tail: int = 100) -> str:
+        return _demux(self._get(
+            f"/containers/{container_id}/logs",
+            {"stdout": "1", "stderr": "1", "tail": str(tail)},
+        ))
+
+    def stream_logs(self, container_id: str, since: int | None = None, follow: bool = False) -> Iterator[str]:
+        """Yield log lines as they arrive, without buffering the whole log.
+
+        Uses its own connection, since a followed stream never completes.
+        """
+        tty = self.inspect(container_id).get("Config", {}).get("Tty", False)
+        params = {"stdout": "1", "stderr": "1", "follow": "1" if follow else "0"}
+        if since is not None:
+            params["since"] = str(since)
+        conn = _UnixConnection(self.socket_path, timeout=None)
+        try:
+            conn.request("GET", f"/containers/{container_id}/logs?{urllib.parse.urlencode(params)}")
+            resp = conn.getresponse()
+            if resp.status >= 400:
+                raise OSError(f"Docker API {resp.status} for logs: {resp.read(200)!r}")
+            pending = b""
+            while True:
+                if tty:
+                    chunk = resp.read1(65536)
+                else:
+                    header = resp.read(8)
+                    chunk = resp.read(struct.unpack(">I", header[4:8])[0]) if len(header) == 8 else b""
+                if not chunk:
+                    break
+                *lines, pending = (pending + chunk).split(b"\n")
+                for line in lines:
+                    yield line.decode("utf-8", errors="replace")
+            if pending:
+                yield pending.decode("utf-8", errors="replace")
+        except http.client.HTTPException as e:
+            raise OSError(f"Docker API log stream failed: {e!r}") from e
+        finally:
+            conn.close()
+
+    def services(self, tail: int = 0) -> list[dict]:
+        """State, health, image digest and (optionally) recent logs per service."""
+        containers = self.containers()
+
+        def describe(c: dict) -> dict:
+            info = self.inspect(c["Id"])
+            image = self._json(f"/images/{c['ImageID']}/json") if c.get("ImageID") else {}
+            state = info.get("State", {})
+            return {
+                "service": c.get("Labels", {}).get("com.docker.compose.service", c["Names"][0].lstrip("/")),
+                "state": state.get("Status", c.get("State", "?")),
+                "health": state.get("Health", {}).get("Status", "-"),
+                "status": c.get("Status", ""),
+                "image": c.get("Image", "?"),
+                "digest": (image.get("RepoDigests") or [image.get("Id", "-")])[0].split("@")[-1],
+                "logs": self.logs(c["Id"], tail) if tail else "",
+            }
+
+        with ThreadPoolExecutor(max_workers=max(1, min(len(containers), 8))) as pool:
+            return sorted(pool.map(describe, containers), key=lambda s: s["service"])
+
+
+def get_client() -> DockerClient | None:
+    """A client for the local Docker Engine, or None if it isn't reachable."""
+    host = os.environ.get("DOCKER_HOST", f"unix://{DEFAULT_SOCKET}")
+    if not host.startswith("unix://"):
+        return None
+    client = DockerClient(host[len("unix://"):], compose_project())
+    try:
+        client.ping()
+    except OSError:
+        return None
+    return client
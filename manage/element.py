@@ -0,0 +1,95 @@
+"""Prune an unpacked Element Web release down to what this deployment uses.
+
+Keeps the languages and themes implied by element-config/config.json,
+drops every other locale, theme stylesheet and all source maps, and
+rewrites i18n/languages.json so Element only offers what is left. Used by
+`setup` and by the Pages workflow:
+
+    python3 -m manage.element build element-config/config.json
+"""
+
+import json
+import re
+import sys
+from pathlib import Path
+
+THEME_CSS = re.compile(r"^theme-(?P<name>[a-z-]+?)(\.[0-9a-f]+)?\.css$")
+
+
+def keep_sets(config: dict) -> tuple[set[str], set[str]]:
+    """(language codes, theme names) to keep for an Element config.
+
+    English is always kept (Element's fallback). Both light and dark stay
+    unless use_system_theme is turned off; custom_themes keep the
+    -custom stylesheets. `prune_bundle` also keeps the -high-contrast
+    variant of every kept theme (Element's accessibility setting).
+    """
+    settings = config.get("setting_defaults", {})
+    languages = {"en", settings.get("language", "en")}
+    default = config.get("default_theme", "light")
+    themes = {default}
+    if settings.get("use_system_theme", True):
+        themes |= {"light", "dark"}
+    if settings.get("custom_themes"):
+        themes |= {"light-custom", "dark-custom"}
+    return languages, themes
+
+
+def _base(code: str) -> str:
+    return re.split(r"[-_]", code, maxsplit=1)[0].lower()
+
+
+def _size(path: Path) -> int:
+    return path.stat().st_size if path.is_file() else sum(f.stat().st_size for f in path.rglob("*") if f.is_file())
+
+
+def prune_bundle(bundle: Path, config: dict) -> dict[str, int]:
+    """Delete unused files from `bundle`. Returns bytes removed per category."""
+    languages, themes = keep_sets(config)
+    keep_bases = {_base(code) for code in languages}
+    removed = {"source maps": 0, "locales": 0, "themes": 0}
+
+    for path in bundle.rglob("*.map"):
+        removed["source maps"] += _size(path)
+        path.unlink()
+
+    index_path = bundle / "i18n" / "languages.json"
+    if index_path.exists():
+        index = json.loads(index_path.read_text())
+        kept = {code: entry for code, entry in index.items() if _base(code) in keep_bases}
+        keep_files = {e if isinstance(e, str) else e.get("fileName") for e in kept.values()}
+        for path in index_path.parent.iterdir():
+            if path.name != "languages.json" and path.name not in keep_files:
+                removed["locales"] += _size(path)
+                path.unlink()
+        index_path.write_text(json.dumps(kept))
+
+    for path in bundle.rglob("theme-*.css"):
+        m = THEME_CSS.match(path.name)
+        if m and m["name"].removesuffix("-high-contrast") not in themes:
+            removed["themes"] += _size(path)
+            path.unlink()
+    return removed
+
+
+def report(bundle: Path, removed: dict[str, int]) -> None:
+    total = sum(removed.values())
+    after = _size(bundle)
+    before = after + total
+    print(f"  Pruned Element bundle: {before / 1e6:.1f} MB -> {after / 1e6:.1f} MB "
+          f"(saved {total / 1e6:.1f} MB, {total / before * 100 if before else 0:.0f}%)")
+    for category, size in removed.items():
+        print(f"    {category:<12} {size / 1e6:>7.1f} MB")
+
+
+def main(argv: list[str]) -> None:
+    if len(argv) != 2:
+        print("usage: python3 -m manage.element BUNDLE_DIR CONFIG_JSON", file=sys.stderr)
+        sys.exit(2)
+    bundle = Path(argv[0])
+    removed = prune_bundle(bundle, json.loads(Path(argv[1]).read_text()))
+    report(bundle, removed)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,312 @@
+"""Load test — register users, chat, measure.
+
+Users register with a freshly minted registration token when the node
+requires one, and through the dummy stage when it doesn't. Admin calls
+(minting the token, lifting rate limits, cleanup) go to the server in
+~/.mesh-admin.json; the client traffic goes to --target, which can be
+localhost or the tunnel URL so both can be measured.
+"""
+
+import http.client
+import json
+import secrets
+import sys
+import threading
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+from manage import trace
+from manage.stats import fmt_seconds, percentile
+from manage.tokens import SynapseError, load_config, synapse_request
+
+SYNC_TIMEOUT_MS = 10000
+SYNC_GRACE_SECONDS = 15
+REGISTER_MAX_ATTEMPTS = 30
+REGISTRATION_TOKEN_TTL = 600
+SUPPORTED_STAGES = {"m.login.registration_token", "m.login.dummy"}
+
+
+class _Client:
+    """Keep-alive HTTP client with one connection per thread."""
+
+    def __init__(self, base_url: str):
+        parsed = urllib.parse.urlparse(base_url)
+        self.https = parsed.scheme == "https"
+        self.host = parsed.netloc
+        self.prefix = parsed.path.rstrip("/")
+        self.local = threading.local()
+
+    def _conn(self) -> http.client.HTTPConnection:
+        conn = getattr(self.local, "conn", None)
+        if conn is None:
+            cls = http.client.HTTPSConnection if self.https else http.client.HTTPConnection
+            conn = self.local.conn = cls(self.host, timeout=SYNC_TIMEOUT_MS / 1000 + 20)
+        return conn
+
+    def request(self, method: str, path: str, body: dict | None = None, token: str | None = None) -> tuple[int, dict]:
+        headers = {"Content-Type": "application/json", "User-Agent": "manage.py-loadtest/1.0"}
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+        data = json.dumps(body).encode() if body is not None else None
+        for attempt in (1, 2):
+            conn = self._conn()
+            try:
+                with trace.span(f"{method} {path.split('?')[0]}", "http"):
+                    conn.request(method, self.prefix + path, body=data, headers=headers)
+                    resp = conn.getresponse()
+                    raw = resp.read()
+                try:
+                    return resp.status, json.loads(raw) if raw else {}
+                except ValueError:
+                    return resp.status, {}  # e.g. an HTML 502/429 page from the tunnel or nginx
+            except (http.client.HTTPException, OSError):
+                conn.close()
+                self.local.conn = None
+                if attempt == 2:
+                    raise
+        raise AssertionError("unreachable")
+
+
+class _Errors:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts: dict[str, list[int]] = {}
+
+    def record(self, op: str, ok: bool) -> None:
+        with self.lock:
+            entry = self.counts.setdefault(op, [0, 0])
+            entry[0] += 1
+            entry[1] += 0 if ok else 1
+
+
+def _next_stage(flows: list[dict], completed: list[str]) -> str | None:
+    """Pick the next UIA stage we can complete, or None if no flow is usable.
+
+    A node that requires a registration token offers a flow containing
+    m.login.registration_token; an open one only offers m.login.dummy.
+    """
+    usable = [f["stages"] for f in flows if set(f.get("stages", [])) <= SUPPORTED_STAGES]
+    usable.sort(key=lambda stages: "m.login.registration_token" not in stages)
+    if not usable:
+        return None
+    return next((s for s in usable[0] if s not in completed), None)
+
+
+def _register(client: _Client, username: str, password: str, reg_token: str) -> tuple[dict | None, float]:
+    """Walk the UIA registration flow; retries on 429. Returns (response, seconds)."""
+    start = time.monotonic()
+    body: dict = {"username": username, "password": password, "inhibit_login": False}
+    session = None
+    for _ in range(REGISTER_MAX_ATTEMPTS):
+        status, data = client.request("POST", "/_matrix/client/v3/register", body)
+        if status == 200:
+            return data, time.monotonic() - start
+        if status == 429:
+            time.sleep(data.get("retry_after_ms", 1000) / 1000)
+            continue
+        if status != 401 or "flows" not in data:
+            return None, time.monotonic() - start
+        session = data.get("session", session)
+        stage = _next_stage(data["flows"], data.get("completed", []))
+        if stage is None:
+            return None, time.monotonic() - start
+        auth = {"type": stage, "session": session}
+        if stage == "m.login.registration_token":
+            auth["token"] = reg_token
+        body["auth"] = auth
+    return None, time.monotonic() - start
+
+
+def _observe(client: _Client, token: str, room_id: str, sent: dict, seen: dict, stop: threading.Event) -> None:
+    """Long-poll /sync and note when each loadtest message arrives."""
+    sync_filter = json.dumps({"room": {"rooms": [room_id], "timeline": {"limit": 50}}, "presence": {"types": []}})
+    query = {"filter": sync_filter, "timeout": "0"}
+    since = None
+    while not stop.is_set():
+        if since:
+            query["since"] = since
+            query["timeout"] = str(SYNC_TIMEOUT_MS)
+        try:
+            status, data = client.request("GET", "/_matrix/client/v3/sync?" + urllib.parse.urlencode(query), token=token)
+        except OSError:
+            status, data = 0, {}
+        now = time.monotonic()
+        if status != 200:
+            time.sleep(1)
+            continue
+        since = data.get("next_batch", since)
+        room = data.get("rooms", {}).get("join", {}).get(room_id, {})
+        for event in room.get("timeline", {}).get("events", []):
+            marker = event.get("content", {}).get("body", "")
+            if marker in sent and marker not in seen:
+                seen[marker] = now
+
+
+def cmd_loadtest(args) -> None:
+    """Register users, have them chat in one room, report latency."""
+    config = load_config()
+    target = getattr(args, "target", None) or config["server_url"]
+    if getattr(args, "tunnel", False):
+        from manage.status import get_tunnel_url
+        target = get_tunnel_url()
+        if not target:
+            print("ERROR: No tunnel URL found in runtime/tunnel-url.", file=sys.stderr)
+            sys.exit(1)
+    n_users, rate, duration = args.users, args.rate, args.duration
+    client = _Client(target)
+    errors = _Errors()
+    run_id = secrets.token_hex(3)
+    password = secrets.token_urlsafe(12)
+
+    print(f"Target: {target}")
+    print(f"Minting a registration token for {n_users} users...")
+    token_data = synapse_request(
+        "POST", "/_synapse/admin/v1/registration_tokens/new", config,
+        body={
+            "length": 16,
+            "uses_allowed": n_users,
+            "expiry_time": int((time.time() + REGISTRATION_TOKEN_TTL) * 1000),
+        },
+    )
+    reg_token = token_data["token"]
+
+    print(f"Registering {n_users} users concurrently (run {run_id})...")
+    reg_latency: list[float] = []
+    users: list[dict] = []
+    try:
+        with ThreadPoolExecutor(max_workers=min(n_users, 32)) as pool:
+            futures = [
+                pool.submit(_register, client, f"loadtest-{run_id}-{i}", password, reg_token)
+                for i in range(n_users)
+            ]
+            for future in futures:
+                try:
+                    data, seconds = future.result()
+                except (http.client.HTTPException, OSError):
+                    data, seconds = None, 0.0
+                errors.record("register", data is not None)
+                if data:
+                    users.append(data)
+                    reg_latency.append(seconds)
+    finally:
+        # Don't leave an open registration token behind, whatever happened.
+        try:
+            synapse_request(
+                "DELETE", f"/_synapse/admin/v1/registration_tokens/{reg_token}", config, raise_errors=True
+            )
+        except (SynapseError, OSError) as e:
+            print(f"  WARNING: could not delete registration token {reg_token}: {e}")
+    if not users:
+        print("ERROR: No users could register.", file=sys.stderr)
+        sys.exit(1)
+
+    for user in users:
+        try:
+            synapse_request(
+                "POST", f"/_synapse/admin/v1/users/{urllib.parse.quote(user['user_id'])}/override_ratelimit",
+                config, body={"messages_per_second": 0, "burst_count": 0}, raise_errors=True,
+            )
+        except SynapseError as e:
+            print(f"  WARNING: could not lift rate limit for {user['user_id']}: {e}")
+
+    owner = users[0]
+    status, room = client.request(
+        "POST", "/_matrix/client/v3/createRoom",
+        {"preset": "public_chat", "name": f"loadtest {run_id}"}, token=owner["access_token"],
+    )
+    errors.record("createRoom", status == 200)
+    if status != 200:
+        print(f"ERROR: createRoom failed: {room}", file=sys.stderr)
+        sys.exit(1)
+    room_id = room["room_id"]
+    quoted_room = urllib.parse.quote(room_id)
+
+    print(f"Joining {len(users) - 1} users to {room_id}...")
+    with ThreadPoolExecutor(max_workers=min(len(users), 32)) as pool:
+        joins = pool.map(
+            lambda u: client.request("POST", f"/_matrix/client/v3/join/{quoted_room}", {}, token=u["access_token"]),
+            users[1:],
+        )
+        for status, _ in joins:
+            errors.record("join", status == 200)
+
+    sent: dict[str, float] = {}
+    seen: dict[str, float] = {}
+    failed: set[str] = set()  # kept in `sent`: Synapse may have stored it anyway
+    send_latency: list[float] = []
+    stop = threading.Event()
+    observer = threading.Thread(
+        target=_observe, args=(_Client(target), owner["access_token"], room_id, sent, seen, stop), daemon=True
+    )
+    observer.start()
+    time.sleep(1)
+
+    def send(i: int) -> None:
+        user = users[i % len(users)]
+        marker = f"loadtest {run_id} #{i}"
+        start = time.monotonic()
+        sent[marker] = start
+        try:
+            status, _ = client.request(
+                "PUT", f"/_matrix/client/v3/rooms/{quoted_room}/send/m.room.message/{run_id}-{i}",
+                {"msgtype": "m.text", "body": marker}, token=user["access_token"],
+            )
+        except Exception:  # anything unexpected counts as a failed send, not a lost one
+            status = 0
+        errors.record("send", status == 200)
+        if status == 200:
+            send_latency.append(time.monotonic() - start)
+        else:
+            failed.add(marker)
+
+    total = int(rate * duration)
+    print(f"Sending {total} messages at {rate}/s for {duration}s...")
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=min(len(users), 64)) as pool:
+        for i in range(total):
+            delay = started + i / rate - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            pool.submit(send, i)
+    elapsed = time.monotonic() - started
+
+    expected = sent.keys() - failed
+    deadline = time.monotonic() + SYNC_GRACE_SECONDS
+    while expected - seen.keys() and time.monotonic() < deadline:
+        time.sleep(0.2)
+    stop.set()
+
+    sync_latency = [seen[m] - sent[m] for m in seen.keys() & sent.keys()]
+
+    print()
+    print(f"Achieved send rate: {len(send_latency) / elapsed:.1f}/s (target {rate}/s)")
+    print(f"{'':<22} {'N':>6} {'P50':>8} {'P95':>8} {'P99':>8} {'MAX':>8}")
+    for label, values in (
+        ("register", reg_latency),
+        ("send (PUT → 200)", send_latency),
+        ("send → sync", sync_latency),
+    ):
+        print(
+            f"{label:<22} {len(values):>6} {fmt_seconds(percentile(values, 50)):>8} "
+            f"{fmt_seconds(percentile(values, 95)):>8} {fmt_seconds(percentile(values, 99)):>8} "
+            f"{fmt_seconds(max(values) if values else None):>8}"
+        )
+    missing = len(expected - seen.keys())
+    if missing:
+        print(f"  {missing} sent messages never showed up in /sync within {SYNC_GRACE_SECONDS}s")
+
+    print("\nErrors:")
+    for op, (count, failed) in errors.counts.items():
+        print(f"  {op:<12} {failed}/{count} ({failed / count * 100:.1f}%)")
+
+    if not getattr(args, "keep_users", False):
+        print(f"\nDeactivating {len(users)} loadtest users...")
+        for user in users:
+            try:
+                synapse_request(
+                    "POST", f"/_synapse/admin/v1/deactivate/{urllib.parse.quote(user['user_id'])}",
+                    config, body={"erase": True}, raise_errors=True,
+                )
+            except SynapseError as e:
+                print(f"  WARNING: could not deactivate {user['user_id']}: {e}")
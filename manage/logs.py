@@ -0,0 +1,178 @@
+"""Synapse access-log analysis — per-endpoint latency from "Processed request" lines.
+
+Lines are streamed from the synapse container and parsed one at a time;
+only the per-request timings are kept, never the log text.
+"""
+
+import re
+import subprocess
+import sys
+import threading
+import time
+from collections import deque
+from collections.abc import Iterator
+
+from manage import docker_api, trace
+from manage.stats import fmt_seconds, percentile
+
+SLOWEST_IDS = 3
+
+# e.g. "... - GET-123 - 172.18.0.1 - 8008 - {@a:localhost} Processed request:
+#   0.003sec/0.000sec (0.001sec, 0.000sec) (0.001sec/0.002sec/2) 1234B 200 "GET /_matrix/... HTTP/1.1" ..."
+PROCESSED_PATTERN = re.compile(
+    r" - (?P<rid>[A-Z]+-\d+) - .*?Processed request: (?P<total>[\d.]+)sec/-?[\d.]+sec "
+    r"\([\d.]+sec, [\d.]+sec\) \([\d.]+sec/(?P<db>[\d.]+)sec/\d+\) "
+    r"\d+B (?P<code>\S+) \"(?P<method>\S+) (?P<uri>\S+)"
+)
+ID_SEGMENT = re.compile(r"^[!@#$+]|%21|%40|%23|%24|%2[bB]|:|^\d+$|\d{4,}")
+MEDIA_SEGMENTS = {"download", "thumbnail"}
+
+
+def endpoint(method: str, uri: str) -> str:
+    """Group a request by route: IDs, aliases, transaction IDs and media IDs become '*'."""
+    parts = uri.split("?", 1)[0].split("/")
+    out = []
+    skip = 0
+    for part in parts:
+        if skip:
+            out.append("*")
+            skip -= 1
+        elif ID_SEGMENT.search(part):
+            out.append("*")
+        else:
+            out.append(part)
+            if part in MEDIA_SEGMENTS:
+                skip = 2  # server name, media ID
+    return f"{method} {'/'.join(out)}"
+
+
+def parse_line(line: str) -> tuple[str, float, float, str] | None:
+    """(endpoint, seconds, DB seconds, request ID) for a request line, else None."""
+    if "Processed request" not in line:
+        return None
+    m = PROCESSED_PATTERN.search(line)
+    if not m:
+        return None
+    return endpoint(m["method"], m["uri"]), float(m["total"]), float(m["db"]), m["rid"]
+
+
+class Aggregate:
+    """Per-endpoint timings, the slowest requests and DB time."""
+
+    def __init__(self):
+        self.endpoints: dict[str, dict] = {}
+
+    def add(self, key: str, seconds: float, db_seconds: float, request_id: str) -> None:
+        entry = self.endpoints.setdefault(key, {"times": [], "db": 0.0, "slowest": []})
+        entry["times"].append(seconds)
+        entry["db"] += db_seconds
+        slowest = entry["slowest"]
+        if len(slowest) < SLOWEST_IDS or seconds > slowest[-1][0]:
+            slowest.append((seconds, request_id))
+            slowest.sort(reverse=True)
+            del slowest[SLOWEST_IDS:]
+
+    def print_table(self, top: int) -> None:
+        rows = sorted(self.endpoints.items(), key=lambda kv: sum(kv[1]["times"]), reverse=True)
+        total = sum(len(e["times"]) for e in self.endpoints.values())
+        print(f"{total} requests across {len(rows)} endpoints")
+        print(f"{'ENDPOINT':<58} {'N':>7} {'P50':>7} {'P95':>7} {'P99':>7} {'DB':>8} {'DB%':>4}  SLOWEST")
+        for key, entry in rows[:top]:
+            times = entry["times"]
+            busy = sum(times)
+            slowest = ", ".join(f"{rid} ({fmt_seconds(t)})" for t, rid in entry["slowest"])
+            print(
+                f"{key[:58]:<58} {len(times):>7} {fmt_seconds(percentile(times, 50)):>7} "
+                f"{fmt_seconds(percentile(times, 95)):>7} {fmt_seconds(percentile(times, 99)):>7} "
+                f"{fmt_seconds(entry['db']):>8} {entry['db'] / busy * 100 if busy else 0:>3.0f}%  {slowest}"
+            )
+
+
+def _synapse_log_lines(since: int | None, follow: bool) -> Iterator[str]:
+    """Stream synapse container log lines via the Docker API, or the CLI as a fallback."""
+    client = docker_api.get_client()
+    if client is not None:
+        container_id = client.container_id("synapse")
+        if container_id is None:
+            print("ERROR: No synapse container — run: ./manage.py up", file=sys.stderr)
+            sys.exit(1)
+        yield from client.stream_logs(container_id, since=since, follow=follow)
+        return
+
+    cmd = ["docker", "compose", "logs", "--no-log-prefix"]
+    if since is not None:
+        cmd += ["--since", str(since)]
+    if follow:
+        cmd.append("--follow")
+    with trace.span(trace.command_label(cmd), "subprocess"):
+        proc = subprocess.Popen(cmd + ["synapse"], stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+        try:
+            yield from (line.rstrip("\n") for line in proc.stdout)
+        finally:
+            proc.terminate()
+            proc.wait()
+
+
+def _follow(lines: Iterator[str], window: int, interval: int, top: int) -> None:
+    """Print rolling-window stats every `interval` seconds until interrupted."""
+    recent: deque = deque()
+    lock = threading.Lock()
+
+    def reader() -> None:
+        for line in lines:
+            parsed = parse_line(line)
+            if parsed:
+                with lock:
+                    recent.append((time.monotonic(), parsed))
+
+    thread = threading.Thread(target=reader, daemon=True)
+    thread.start()
+    print(f"Following synapse logs; stats over the last {window}s every {interval}s (Ctrl-C to stop)")
+    try:
+        while thread.is_alive():
+            time.sleep(interval)
+            cutoff = time.monotonic() - window
+            agg = Aggregate()
+            with lock:
+                while recent and recent[0][0] < cutoff:
+                    recent.popleft()
+                for _, parsed in recent:
+                    agg.add(*parsed)
+            print(f"\n--- {time.strftime('%H:%M:%S')}, last {window}s ---")
+            agg.print_table(top)
+    except KeyboardInterrupt:
+        print()
+
+
+def _logs_analyze(args) -> None:
+    from manage.tokens import parse_duration
+
+    since = parse_duration(args.since, past=True) // 1000 if args.since else None
+    lines = _synapse_log_lines(since, args.follow)
+    if args.follow:
+        _follow(lines, args.window, args.interval, args.top)
+        return
+
+    agg = Aggregate()
+    scanned = 0
+    started = time.monotonic()
+    with trace.span("parse synapse logs", "logs"):
+        for line in lines:
+            scanned += 1
+            parsed = parse_line(line)
+            if parsed:
+                agg.add(*parsed)
+    print(f"Scanned {scanned} log lines in {time.monotonic() - started:.1f}s"
+          + (f" (since {args.since} ago)" if args.since else ""))
+    agg.print_table(args.top)
+
+
+def cmd_logs(args) -> None:
+    """Dispatch logs subcommands."""
+    dispatch = {
+        "analyze": _logs_analyze,
+    }
+    if args.logs_cmd not in dispatch:
+        print(f"Unknown logs subcommand: {args.logs_cmd}", file=sys.stderr)
+        sys.exit(1)
+    dispatch[args.logs_cmd](args)
@@ -0,0 +1,162 @@
+"""Media store management — audit disk usage, purge cached remote media."""
+
+import os
+import re
+import sqlite3
+import sys
+import urllib.error
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from manage.backup import DATA_DIR, DB_NAME, hash_file, uses_postgres
+
+MEDIA_STORE = DATA_DIR / "media_store"
+MXC_PATTERN = re.compile(r"mxc://([^/\"]+)/([A-Za-z0-9_-]+)")
+PURGE_TIMEOUT = 3600
+
+# Top-level media_store directories, grouped by where the bytes came from.
+CATEGORIES = {
+    "local_content": "local uploads",
+    "local_thumbnails": "local uploads",
+    "remote_content": "remote cache",
+    "remote_thumbnail": "remote cache",
+    "url_cache": "url previews",
+    "url_cache_thumbnails": "url previews",
+}
+
+
+def _mib(n: float) -> str:
+    return f"{n / 1024 ** 2:,.1f} MiB"
+
+
+def _hash_entry(path: str) -> tuple[str, int, str | None]:
+    try:
+        return path, os.path.getsize(path), hash_file(Path(path))
+    except OSError:
+        return path, 0, None
+
+
+def _scan(store: Path, workers: int | None) -> list[tuple[str, int, str | None]]:
+    paths = [os.path.join(root, name) for root, _, files in os.walk(store) for name in files]
+    print(f"Hashing {len(paths)} files...")
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        return list(pool.map(_hash_entry, paths, chunksize=64))
+
+
+def _attribution(db_path: Path, by_room: bool) -> tuple[dict, dict] | None:
+    """Bytes per uploading user and, if `by_room`, per room, from the Synapse database.
+
+    The per-room pass scans every message event for mxc:// URIs, so it is
+    only run on request (--by-room).
+    """
+    try:
+        conn = sqlite3.connect(f"file:{db_path}?mode=ro", uri=True)
+        sizes = {}
+        by_user: dict = defaultdict(int)
+        for media_id, user_id, length in conn.execute(
+            "SELECT media_id, user_id, media_length FROM local_media_repository"
+        ):
+            sizes[media_id] = length or 0
+            by_user[user_id] += length or 0
+        for origin, media_id, length in conn.execute(
+            "SELECT media_origin, media_id, media_length FROM remote_media_cache"
+        ):
+            sizes[(origin, media_id)] = length or 0
+
+        rooms: dict = defaultdict(int)
+        if by_room:
+            rows = conn.execute(
+                "SELECT e.room_id, j.json FROM events e JOIN event_json j USING (event_id)"
+                " WHERE e.type IN ('m.room.message', 'm.sticker') AND j.json LIKE '%mxc://%'"
+            )
+            for room_id, raw in rows:
+                for origin, media_id in set(MXC_PATTERN.findall(raw)):
+                    rooms[room_id] += sizes.get(media_id, sizes.get((origin, media_id), 0))
+        conn.close()
+        return by_user, rooms
+    except sqlite3.Error as e:
+        print(f"  (could not read {db_path}: {e})")
+        return None
+
+
+def _media_audit(args) -> None:
+    store = MEDIA_STORE
+    if not store.exists():
+        print(f"No media store at {store}", file=sys.stderr)
+        sys.exit(1)
+    top = getattr(args, "top", 10)
+
+    entries = _scan(store, getattr(args, "workers", None))
+    total = sum(size for _, size, _ in entries)
+    print(f"\nTotal: {len(entries)} files, {_mib(total)}")
+
+    print("\n--- By source ---")
+    by_category: dict = defaultdict(lambda: [0, 0])
+    for path, size, _ in entries:
+        top_dir = Path(path).relative_to(store).parts[0]
+        bucket = by_category[CATEGORIES.get(top_dir, top_dir)]
+        bucket[0] += 1
+        bucket[1] += size
+    for label, (count, size) in sorted(by_category.items(), key=lambda kv: -kv[1][1]):
+        pct = size / total * 100 if total else 0
+        print(f"  {label:<16} {count:>8} files  {_mib(size):>14}  {pct:5.1f}%")
+
+    print("\n--- Duplicate content ---")
+    groups: dict = defaultdict(list)
+    for path, size, digest in entries:
+        if digest:
+            groups[digest].append((path, size))
+    dupes = [(g[0][1] * (len(g) - 1), g) for g in groups.values() if len(g) > 1]
+    dupes.sort(key=lambda d: d[0], reverse=True)
+    wasted = sum(w for w, _ in dupes)
+    print(f"  {len(dupes)} duplicated blobs, {_mib(wasted)} reclaimable")
+    for waste, group in dupes[:top]:
+        print(f"  {len(group)}x {_mib(group[0][1])}  {Path(group[0][0]).relative_to(store)}")
+
+    if uses_postgres():
+        print("\n(Per-user and per-room attribution needs the SQLite database; Synapse uses PostgreSQL.)")
+        return
+    result = _attribution(DATA_DIR / DB_NAME, getattr(args, "by_room", False))
+    if result:
+        by_user, by_room = result
+        print("\n--- Largest uploaders ---")
+        for user, size in sorted(by_user.items(), key=lambda kv: -kv[1])[:top]:
+            print(f"  {user:<40} {_mib(size):>14}")
+        if not getattr(args, "by_room", False):
+            return
+        print("\n--- Largest rooms (media referenced by messages) ---")
+        for room, size in sorted(by_room.items(), key=lambda kv: -kv[1])[:top]:
+            print(f"  {room:<40} {_mib(size):>14}")
+
+
+def _media_purge(args) -> None:
+    from manage.tokens import load_config, parse_duration, synapse_request
+
+    config = load_config()
+    before_ts = parse_duration(args.older_than, past=True)
+    timeout = getattr(args, "timeout", None) or PURGE_TIMEOUT
+    print(f"Purging remote media cached more than {args.older_than} ago (waiting up to {timeout}s)...")
+    try:
+        data = synapse_request(
+            "POST", f"/_synapse/admin/v1/purge_media_cache?before_ts={before_ts}", config, body={},
+            timeout=timeout,
+        )
+    except (TimeoutError, urllib.error.URLError) as e:
+        print(f"ERROR: no answer from Synapse ({getattr(e, 'reason', e)}).", file=sys.stderr)
+        print("Synapse keeps purging in the background; re-run later (or with a larger --timeout) "
+              "to see what is left.", file=sys.stderr)
+        sys.exit(1)
+    print(f"Deleted {data.get('deleted', 0)} cached remote media files.")
+
+
+def cmd_media(args) -> None:
+    """Dispatch media subcommands."""
+    dispatch = {
+        "audit": _media_audit,
+        "purge": _media_purge,
+    }
+    if args.media_cmd not in dispatch:
+        print(f"Unknown media subcommand: {args.media_cmd}", file=sys.stderr)
+        sys.exit(1)
+    dispatch[args.media_cmd](args)
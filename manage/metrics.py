@@ -0,0 +1,215 @@
+"""Synapse Prometheus metrics — scrape, aggregate, report hot spots.
+
+The metrics listener is enabled by `./manage.py setup` on port 9000 (bound
+to localhost only by docker-compose.yml, never exposed through the tunnel).
+"""
+
+import math
+import sys
+import time
+import urllib.error
+import urllib.request
+from typing import Iterator
+
+METRICS_URL = "http://localhost:9000/_synapse/metrics"
+
+
+def parse_exposition(lines) -> Iterator[tuple[str, dict, float]]:
+    """Yield (name, labels, value) from Prometheus text exposition lines.
+
+    Works line by line so a scrape never has to be held in memory.
+    """
+    for raw in lines:
+        line = raw.decode("utf-8", errors="replace") if isinstance(raw, bytes) else raw
+        line = line.strip()
+        if not line or line.startswith("#"):
+            continue
+        labels: dict = {}
+        brace = line.find("{")
+        if brace == -1:
+            name, _, rest = line.partition(" ")
+        else:
+            name = line[:brace]
+            i = brace + 1
+            while line[i] != "}":
+                eq = line.index("=", i)
+                key = line[i:eq].strip().lstrip(",").strip()
+                i = eq + 2  # skip ="
+                value = []
+                while line[i] != '"':
+                    if line[i] == "\\":
+                        i += 1
+                        value.append({"n": "\n"}.get(line[i], line[i]))
+                    else:
+                        value.append(line[i])
+                    i += 1
+                labels[key] = "".join(value)
+                i += 1
+                while line[i] in ", ":
+                    i += 1
+            rest = line[i + 1:]
+        fields = rest.split()
+        if not fields:
+            continue
+        try:
+            yield name, labels, float(fields[0])
+        except ValueError:
+            continue
+
+
+def _new_snapshot() -> dict:
+    return {
+        "time": time.time(),
+        "start": None,
+        "servlets": {},
+        "db": {},
+        "caches": {},
+        "events": 0.0,
+    }
+
+
+def scrape(url: str = METRICS_URL) -> dict:
+    """Stream one scrape into an aggregated snapshot."""
+    snap = _new_snapshot()
+    req = urllib.request.Request(url, headers={"User-Agent": "manage.py/1.0"})
+    try:
+        with urllib.request.urlopen(req, timeout=10) as resp:
+            for name, labels, value in parse_exposition(resp):
+                _accumulate(snap, name, labels, value)
+    except (urllib.error.URLError, OSError) as e:
+        print(f"ERROR: Could not scrape {url}: {e}", file=sys.stderr)
+        print("Is the metrics listener enabled? Run: ./manage.py setup", file=sys.stderr)
+        sys.exit(1)
+    return snap
+
+
+def _accumulate(snap: dict, name: str, labels: dict, value: float) -> None:
+    if name.endswith("_total"):
+        name = name[: -len("_total")]
+
+    if name.startswith("synapse_http_server_response_time_seconds"):
+        key = (labels.get("method", "?"), labels.get("servlet", "?"))
+        entry = snap["servlets"].setdefault(key, {"buckets": {}, "sum": 0.0, "count": 0.0})
+        if name.endswith("_bucket"):
+            le = float(labels["le"])
+            entry["buckets"][le] = entry["buckets"].get(le, 0.0) + value
+        elif name.endswith("_sum"):
+            entry["sum"] += value
+        elif name.endswith("_count"):
+            entry["count"] += value
+
+    elif name in ("synapse_storage_transaction_time_sum", "synapse_storage_transaction_time_count"):
+        entry = snap["db"].setdefault(labels.get("desc", "?"), {"sum": 0.0, "count": 0.0})
+        entry[name.rsplit("_", 1)[-1]] += value
+
+    elif name in ("synapse_util_caches_cache_hits", "synapse_util_caches_cache_misses"):
+        entry = snap["caches"].setdefault(labels.get("name", "?"), {"hits": 0.0, "misses": 0.0})
+        entry[name.rsplit("_", 1)[-1]] += value
+
+    elif name == "synapse_storage_events_persisted_events":
+        snap["events"] += value
+
+    elif name == "process_start_time_seconds":
+        snap["start"] = value
+
+
+def diff_snapshots(before: dict, after: dict) -> dict:
+    """Counter deltas between two snapshots of the same process."""
+    out = _new_snapshot()
+    out["time"] = after["time"]
+    out["start"] = before["time"]
+    for key, entry in after["servlets"].items():
+        prev = before["servlets"].get(key, {"buckets": {}, "sum": 0.0, "count": 0.0})
+        out["servlets"][key] = {
+            "buckets": {le: n - prev["buckets"].get(le, 0.0) for le, n in entry["buckets"].items()},
+            "sum": entry["sum"] - prev["sum"],
+            "count": entry["count"] - prev["count"],
+        }
+    for desc, entry in after["db"].items():
+        prev = before["db"].get(desc, {"sum": 0.0, "count": 0.0})
+        out["db"][desc] = {k: entry[k] - prev[k] for k in entry}
+    for cache, entry in after["caches"].items():
+        prev = before["caches"].get(cache, {"hits": 0.0, "misses": 0.0})
+        out["caches"][cache] = {k: entry[k] - prev[k] for k in entry}
+    out["events"] = after["events"] - before["events"]
+    return out
+
+
+def histogram_quantile(q: float, buckets: dict[float, float]) -> float | None:
+    """Prometheus-style quantile estimate from cumulative buckets."""
+    if not buckets:
+        return None
+    ordered = sorted(buckets.items())
+    total = ordered[-1][1]
+    if total <= 0:
+        return None
+    rank = q * total
+    prev_le, prev_count = 0.0, 0.0
+    for le, count in ordered:
+        if count >= rank:
+            if math.isinf(le):
+                return prev_le
+            if count == prev_count:
+                return le
+            return prev_le + (le - prev_le) * (rank - prev_count) / (count - prev_count)
+        prev_le, prev_count = le, count
+    return prev_le
+
+
+def report(snap: dict, top: int = 10, sort: str = "total") -> None:
+    interval = snap["time"] - snap["start"] if snap["start"] else None
+    if interval:
+        print(f"Window: {interval:.0f}s")
+
+    print("\n--- Slowest servlets ---")
+    rows = []
+    for (method, servlet), entry in snap["servlets"].items():
+        if entry["count"] <= 0:
+            continue
+        p95 = histogram_quantile(0.95, entry["buckets"]) or 0.0
+        rows.append((f"{method} {servlet}", entry["count"], p95, entry["sum"]))
+    rows.sort(key=lambda r: r[2] if sort == "p95" else r[3], reverse=True)
+    print(f"{'SERVLET':<50} {'REQS':>8} {'P95':>9} {'TOTAL':>10}")
+    for label, count, p95, total in rows[:top]:
+        print(f"{label[:50]:<50} {count:>8.0f} {p95 * 1000:>7.0f}ms {total:>9.1f}s")
+
+    print("\n--- DB transaction hotspots ---")
+    rows = sorted(
+        ((desc, e["count"], e["sum"]) for desc, e in snap["db"].items() if e["count"] > 0),
+        key=lambda r: r[2], reverse=True,
+    )
+    print(f"{'TRANSACTION':<50} {'COUNT':>8} {'AVG':>9} {'TOTAL':>10}")
+    for desc, count, total in rows[:top]:
+        print(f"{desc[:50]:<50} {count:>8.0f} {total / count * 1000:>7.1f}ms {total:>9.1f}s")
+
+    print("\n--- Cache hit ratios (busiest) ---")
+    rows = sorted(
+        ((name, e["hits"], e["misses"]) for name, e in snap["caches"].items() if e["hits"] + e["misses"] > 0),
+        key=lambda r: r[1] + r[2], reverse=True,
+    )
+    print(f"{'CACHE':<50} {'LOOKUPS':>10} {'HIT%':>7}")
+    for name, hits, misses in rows[:top]:
+        print(f"{name[:50]:<50} {hits + misses:>10.0f} {hits / (hits + misses) * 100:>6.1f}%")
+
+    print("\n--- Event persistence ---")
+    rate = f" ({snap['events'] / interval:.2f}/s)" if interval else ""
+    print(f"  Events persisted: {snap['events']:.0f}{rate}")
+
+
+def cmd_metrics(args) -> None:
+    """Scrape Synapse metrics and print a hot-spot report."""
+    url = getattr(args, "url", None) or METRICS_URL
+    top = getattr(args, "top", 10)
+    sort = getattr(args, "sort", "total")
+    interval = getattr(args, "diff", None)
+
+    if interval:
+        before = scrape(url)
+        print(f"Scraped {url}; waiting {interval}s for the second scrape...")
+        time.sleep(interval)
+        snap = diff_snapshots(before, scrape(url))
+    else:
+        snap = scrape(url)
+        if snap["start"]:
+            print("Totals since Synapse started.")
+    report(snap, top=top, sort=sort)
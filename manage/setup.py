@@ -3,16 +3,21 @@
 Ported from the Makefile setup targets.
 """
 
+import difflib
+import json
 import subprocess
 import sys
 from pathlib import Path
 
+from manage import trace
+
 ELEMENT_VERSION = "v1.12.10"
 REPO_ROOT = Path(__file__).parent.parent
 
 
 def _run(args: list[str], **kwargs) -> subprocess.CompletedProcess:
-    return subprocess.run(args, **kwargs)
+    with trace.span(trace.command_label(args), "subprocess"):
+        return subprocess.run(args, **kwargs)
 
 
 def _run_or_die(args: list[str], desc: str) -> None:
@@ -31,15 +36,21 @@ def element_download() -> None:
     element_dir.mkdir(parents=True, exist_ok=True)
     url = f"https://github.com/element-hq/element-web/releases/download/{ELEMENT_VERSION}/element-{ELEMENT_VERSION}.tar.gz"
     print(f"  Downloading Element {ELEMENT_VERSION}...")
-    result = subprocess.run(
-        f"curl -L {url} | tar xz --strip-components=1 -C element",
-        shell=True,
-        cwd=REPO_ROOT,
-    )
+    with trace.span("curl | tar (element)", "subprocess"):
+        result = subprocess.run(
+            f"curl -L {url} | tar xz --strip-components=1 -C element",
+            shell=True,
+            cwd=REPO_ROOT,
+        )
     if result.returncode != 0:
         print("ERROR: Element download failed", file=sys.stderr)
         sys.exit(result.returncode)
 
+    from manage.element import prune_bundle, report
+
+    config = json.loads((REPO_ROOT / "element-config" / "config.json").read_text())
+    report(element_dir, prune_bundle(element_dir, config))
+
 
 def element_configure() -> None:
     print("  Copying element-config/ and discovery files into element/...")
@@ -68,49 +79,196 @@ def synapse_generate() -> None:
     )
 
 
-def synapse_configure() -> None:
+BASE_SETTINGS = {
+    "enable_registration": True,
+    "enable_registration_without_verification": True,
+    "auto_join_rooms": [
+        "#tech-frederick:localhost",
+        "#general:localhost",
+        "#random:localhost",
+    ],
+    "auto_join_rooms_for_guests": False,
+    "enable_metrics": True,
+}
+
+PROFILES = {
+    "small": {
+        "caches": {
+            "global_factor": 0.25,
+            "per_cache_factors": {"get_users_in_room": 1.0, "get_current_state_ids": 1.0},
+            "expire_caches": True,
+            "cache_entry_ttl": "30m",
+        },
+        "event_cache_size": "5K",
+        "presence": {"enabled": False},
+        "max_upload_size": "10M",
+        "max_image_pixels": "16M",
+    },
+    "medium": {
+        "caches": {
+            "global_factor": 1.0,
+            "per_cache_factors": {"get_users_in_room": 2.0, "get_current_state_ids": 2.0},
+            "expire_caches": True,
+            "cache_entry_ttl": "1h",
+        },
+        "event_cache_size": "25K",
+        "presence": {"enabled": True},
+        "max_upload_size": "50M",
+        "max_image_pixels": "32M",
+    },
+    "large": {
+        "caches": {
+            "global_factor": 2.0,
+            "per_cache_factors": {
+                "get_users_in_room": 4.0,
+                "get_current_state_ids": 4.0,
+                "get_users_who_share_room_with_user": 2.0,
+            },
+            "expire_caches": True,
+            "cache_entry_ttl": "2h",
+        },
+        "event_cache_size": "100K",
+        "presence": {"enabled": True},
+        "max_upload_size": "100M",
+        "max_image_pixels": "64M",
+    },
+}
+
+MANAGED_MARKER = "# --- managed by ./manage.py setup ---"
+
+
+def detect_profile() -> str:
+    """Pick a profile from host cores and RAM."""
+    import os
+
+    cores = os.cpu_count() or 1
+    try:
+        ram_gb = os.sysconf("SC_PAGE_SIZE") * os.sysconf("SC_PHYS_PAGES") / 1024 ** 3
+    except (ValueError, OSError, AttributeError):
+        ram_gb = 0.0
+    print(f"  Host: {cores} cores, {ram_gb:.1f} GiB RAM")
+    if cores <= 2 or ram_gb < 3:
+        return "small"
+    if cores >= 8 and ram_gb >= 16:
+        return "large"
+    return "medium"
+
+
+def _yaml_scalar(value) -> str:
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if isinstance(value, (int, float)):
+        return str(value)
+    return json.dumps(value)
+
+
+def _yaml_lines(key: str, value, indent: int = 0) -> list[str]:
+    pad = "  " * indent
+    if isinstance(value, dict):
+        lines = [f"{pad}{key}:"]
+        for k, v in value.items():
+            lines += _yaml_lines(k, v, indent + 1)
+        return lines
+    if isinstance(value, list):
+        return [f"{pad}{key}:"] + [f"{pad}  - {_yaml_scalar(v)}" for v in value]
+    return [f"{pad}{key}: {_yaml_scalar(value)}"]
+
+
+def merge_settings(content: str, settings: dict) -> str:
+    """Set top-level keys in homeserver.yaml text, replacing existing blocks.
+
+    Keys already present are rewritten in place; new keys are appended
+    under a marker comment. Running it twice gives the same file.
+    """
+    lines = content.splitlines()
+    for key, value in settings.items():
+        block = _yaml_lines(key, value)
+        start = next((i for i, line in enumerate(lines) if line.startswith(f"{key}:")), None)
+        if start is None:
+            if MANAGED_MARKER not in lines:
+                lines += ["", MANAGED_MARKER]
+            lines += block
+            continue
+        end = start + 1
+        while end < len(lines) and (not lines[end].strip() or lines[end].startswith((" ", "\t", "- "))):
+            end += 1
+        while end > start + 1 and not lines[end - 1].strip():
+            end -= 1
+        lines[start:end] = block
+    return "\n".join(lines) + "\n"
+
+
+def synapse_configure(profile: str = "auto") -> None:
     homeserver_yaml = REPO_ROOT / "data" / "homeserver.yaml"
     if not homeserver_yaml.exists():
         print("ERROR: Run `./manage.py setup` or `synapse generate` first.", file=sys.stderr)
         sys.exit(1)
 
+    if profile == "auto":
+        profile = detect_profile()
+    print(f"  Performance profile: {profile}")
+
     content = homeserver_yaml.read_text()
-    if "enable_registration:" in content:
-        print("  Synapse already configured, skipping.")
+    updated = merge_settings(content, {**BASE_SETTINGS, **PROFILES[profile]})
+    if updated == content:
+        print("  Synapse config already up to date.")
         return
 
-    additions = [
-        "",
-        "enable_registration: true",
-        "enable_registration_without_verification: true",
-        "",
-        "auto_join_rooms:",
-        '  - "#tech-frederick:localhost"',
-        '  - "#general:localhost"',
-        '  - "#random:localhost"',
-        "auto_join_rooms_for_guests: false",
-    ]
-    homeserver_yaml.write_text(content + "\n".join(additions) + "\n")
-    print("  Synapse configured.")
+    diff = difflib.unified_diff(
+        content.splitlines(), updated.splitlines(),
+        "homeserver.yaml (before)", "homeserver.yaml (after)", lineterm="",
+    )
+    for line in diff:
+        print(f"    {line}")
+    homeserver_yaml.write_text(updated)
+    print("  Synapse configured. Restart synapse to apply: docker compose restart synapse")
+
+
+def synapse_enable_metrics() -> None:
+    """Turn on Synapse's Prometheus listener on port 9000."""
+    homeserver_yaml = REPO_ROOT / "data" / "homeserver.yaml"
+    content = homeserver_yaml.read_text()
+    if "type: metrics" in content:
+        print("  Metrics listener already enabled, skipping.")
+        return
+
+    listener = (
+        "  - port: 9000\n"
+        "    type: metrics\n"
+        "    bind_addresses: ['0.0.0.0']\n"
+    )
+    if "\nlisteners:\n" not in content:
+        print("ERROR: No `listeners:` block found in homeserver.yaml", file=sys.stderr)
+        sys.exit(1)
+    content = content.replace("\nlisteners:\n", "\nlisteners:\n" + listener, 1)
+    homeserver_yaml.write_text(content)
+    print("  Metrics listener enabled on port 9000.")
 
 
 def admin_user() -> None:
-    """Create the admin user. Requires services to be running."""
-    import time, urllib.request, urllib.error
+    """Create the admin user. Requires services to be running.
+
+    Readiness is checked from inside the container, like the registration
+    itself: with workers the router owns host port 8008, and it isn't
+    started at this point.
+    """
+    import time
 
     print("  Waiting for Synapse to be ready...")
-    for attempt in range(1, 11):
-        try:
-            urllib.request.urlopen(
-                "http://localhost:8008/_matrix/client/versions", timeout=2
+    probe = "import urllib.request; urllib.request.urlopen('http://localhost:8008/_matrix/client/versions', timeout=2)"
+    with trace.span("wait for synapse", "wait"):
+        for attempt in range(1, 11):
+            result = _run(
+                ["docker", "compose", "exec", "-T", "synapse", "python", "-c", probe],
+                capture_output=True,
             )
-            break
-        except Exception:
+            if result.returncode == 0:
+                break
             print(f"    attempt {attempt}...")
             time.sleep(2)
-    else:
-        print("ERROR: Synapse did not become ready in time.", file=sys.stderr)
-        sys.exit(1)
+        else:
+            print("ERROR: Synapse did not become ready in time.", file=sys.stderr)
+            sys.exit(1)
 
     _run_or_die(
         [
@@ -176,7 +334,14 @@ def cmd_setup(args) -> None:
         ("Downloading Element", element_download),
         ("Configuring Element", element_configure),
         ("Generating Synapse config", synapse_generate),
-        ("Configuring Synapse", synapse_configure),
+        ("Configuring Synapse", lambda: synapse_configure(getattr(args, "profile", None) or "auto")),
+        ("Enabling Synapse metrics", synapse_enable_metrics),
+    ]
+    if getattr(args, "workers", None):
+        from manage.workers import configure_workers
+
+        steps.append(("Configuring Synapse workers", lambda: configure_workers(args.workers)))
+    steps += [
         ("Starting Synapse", start_synapse),
         ("Creating admin user", admin_user),
         ("Setting up GitHub Pages", gh_setup),
@@ -184,7 +349,8 @@ def cmd_setup(args) -> None:
 
     for label, fn in steps:
         print(f"\n[{label}]")
-        fn()
+        with trace.span(label, "step"):
+            fn()
 
     print("\nSetup complete.")
     print("Next steps:")
@@ -0,0 +1,21 @@
+"""Small statistics helpers shared by the timing and benchmark commands."""
+
+import math
+
+
+def percentile(values: list[float], pct: float) -> float | None:
+    """Nearest-rank percentile of `values` (pct in 0..100). None if empty."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+def fmt_seconds(value: float | None) -> str:
+    """Format a duration for tables: '12.3s', '450ms', or '-'."""
+    if value is None:
+        return "-"
+    if value < 1:
+        return f"{value * 1000:.0f}ms"
+    return f"{value:.1f}s"
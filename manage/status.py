@@ -1,4 +1,4 @@
-"""Status checks — docker, localhost, tunnel, GitHub Pages.
+"""Status checks — docker, localhost, tunnel, GitHub Pages, media cache.
 
 Ported from scripts/status.py.
 """
@@ -11,14 +11,22 @@ import urllib.error
 import urllib.request
 from pathlib import Path
 
+from manage import docker_api, trace
+
 TUNNEL_URL_FILE = Path(__file__).parent.parent / "runtime" / "tunnel-url"
 
+# Router access-log lines (log_format frederick in router/cache-zone.conf).
+ROUTER_LOG_PATTERN = re.compile(r'"\S+ (?P<uri>\S+)[^"]*" \d+ (?P<bytes>\d+) \S+ cache=(?P<cache>\S+)')
+CACHE_LOG_LINES = 5000
+CACHE_HITS = {"HIT", "STALE", "UPDATING", "REVALIDATED"}
+
 
 def _run(cmd: list[str] | str, timeout: int = 10, shell: bool = False) -> subprocess.CompletedProcess:
     try:
-        return subprocess.run(
-            cmd, shell=shell, capture_output=True, text=True, timeout=timeout
-        )
+        with trace.span(trace.command_label(cmd), "subprocess"):
+            return subprocess.run(
+                cmd, shell=shell, capture_output=True, text=True, timeout=timeout
+            )
     except subprocess.TimeoutExpired:
         return subprocess.CompletedProcess(
             cmd, returncode=1, stdout="", stderr=f"Command timed out after {timeout}s"
@@ -65,9 +73,40 @@ def _section(title: str) -> None:
     print(f"{'=' * 60}\n")
 
 
+def _check_docker_api(client: docker_api.DockerClient, verbose: bool) -> None:
+    services = client.services(tail=10 if verbose else 0)
+    if not services:
+        print(f"  No containers for compose project '{client.project}' — run: ./manage.py up")
+        return
+
+    print("--- Containers ---")
+    print(f"  {'SERVICE':<16} {'STATE':<10} {'HEALTH':<10} {'IMAGE':<36} DIGEST")
+    for s in services:
+        print(f"  {s['service']:<16} {s['state']:<10} {s['health']:<10} {s['image'][:36]:<36} {s['digest'][:19]}")
+    print()
+
+    if verbose:
+        print("--- tunnel-watcher health ---")
+        http_check("http://localhost:8081/healthz", verbose=False)
+        print()
+
+        for s in services:
+            print(f"--- Recent {s['service']} logs (last 10) ---")
+            print(s["logs"].rstrip() or "  (no output)")
+            print()
+
+
 def check_docker(verbose: bool = True) -> None:
     _section("Docker")
 
+    client = docker_api.get_client()
+    if client is not None:
+        try:
+            _check_docker_api(client, verbose)
+            return
+        except OSError as e:
+            print(f"  Docker API error ({e}); falling back to the docker CLI")
+
     print("--- Containers ---")
     r = _run(["docker", "compose", "ps"])
     print(r.stdout)
@@ -79,6 +118,10 @@ def check_docker(verbose: bool = True) -> None:
         r = _run(["docker", "compose", "images"])
         print(r.stdout)
 
+        print("--- tunnel-watcher health ---")
+        http_check("http://localhost:8081/healthz", verbose=False)
+        print()
+
         print("--- Recent cloudflared logs (last 10) ---")
         r = _run(["docker", "compose", "logs", "cloudflared", "--tail", "10"])
         print(r.stdout)
@@ -103,6 +146,15 @@ def check_localhost(verbose: bool = True) -> None:
         except (json.JSONDecodeError, IndexError):
             pass
 
+    if verbose:
+        print()
+        print("--- Synapse metrics (http://localhost:9000) ---")
+        result = http_check("http://localhost:9000/_synapse/metrics", verbose=False)
+        if result["status"] == 200:
+            print("  Metrics listener is up — see: ./manage.py metrics")
+        else:
+            print("  Metrics listener not reachable — run: ./manage.py setup")
+
     print()
     print("--- Element (http://localhost:8080) ---")
     result = http_check("http://localhost:8080", verbose=verbose)
@@ -233,6 +285,58 @@ def check_pages(verbose: bool = True) -> None:
         print()
 
 
+def _router_logs(tail: int) -> str | None:
+    client = docker_api.get_client()
+    if client is not None:
+        try:
+            container_id = client.container_id("router")
+            return client.logs(container_id, tail=tail) if container_id else None
+        except OSError:
+            pass
+    r = _run(["docker", "compose", "logs", "--no-log-prefix", "--tail", str(tail), "router"])
+    return r.stdout if r.returncode == 0 else None
+
+
+def cache_stats(logs: str) -> dict[str, dict]:
+    """Per-category (media, versions) request, hit and byte counts from router logs."""
+    totals: dict[str, dict] = {}
+    for m in ROUTER_LOG_PATTERN.finditer(logs):
+        if m["cache"] == "-":
+            continue  # not a cached location
+        kind = "versions" if m["uri"].startswith("/_matrix/client/versions") else "media"
+        entry = totals.setdefault(kind, {"requests": 0, "hits": 0, "bytes": 0, "hit_bytes": 0})
+        size = int(m["bytes"])
+        entry["requests"] += 1
+        entry["bytes"] += size
+        if m["cache"] in CACHE_HITS:
+            entry["hits"] += 1
+            entry["hit_bytes"] += size
+    return totals
+
+
+def check_cache(verbose: bool = True) -> None:
+    _section("Media cache")
+
+    logs = _router_logs(CACHE_LOG_LINES)
+    if logs is None:
+        print("  Router is not running — run: ./manage.py up")
+        return
+    totals = cache_stats(logs)
+    if not totals:
+        print(f"  No cacheable requests in the last {CACHE_LOG_LINES} router log lines")
+        print("  (MEDIA_CACHE=off in .env disables the cache)")
+        return
+
+    print(f"  {'':<10} {'REQUESTS':>9} {'HIT RATIO':>10} {'SERVED':>10} {'FROM CACHE':>11}")
+    for kind, entry in sorted(totals.items()):
+        ratio = entry["hits"] / entry["requests"] * 100
+        print(f"  {kind:<10} {entry['requests']:>9} {ratio:>9.0f}% "
+              f"{entry['bytes'] / 1e6:>8.1f}MB {entry['hit_bytes'] / 1e6:>9.1f}MB")
+    if verbose:
+        print()
+        print(f"  (last {CACHE_LOG_LINES} router log lines; size limit MEDIA_CACHE_SIZE, default 1g)")
+
+
 def cmd_status(args) -> None:
     """Run requested status checks."""
     checks = {
@@ -240,6 +344,7 @@ def cmd_status(args) -> None:
         "localhost": check_localhost,
         "tunnel": check_tunnel,
         "pages": check_pages,
+        "cache": check_cache,
     }
 
     sections_arg = getattr(args, "section", None)
@@ -6,9 +6,12 @@ Ported from mesh-admin/mesh_admin.py.
 import json
 import sys
 import urllib.error
+import urllib.parse
 import urllib.request
+from concurrent.futures import ThreadPoolExecutor
 from datetime import datetime, timedelta
 from pathlib import Path
+from typing import Iterator
 
 CONFIG_PATH = Path.home() / ".mesh-admin.json"
 
@@ -26,7 +29,20 @@ def save_config(config: dict) -> None:
     CONFIG_PATH.chmod(0o600)
 
 
-def synapse_request(method: str, endpoint: str, config: dict, body: dict | None = None) -> dict:
+class SynapseError(Exception):
+    """An admin API call returned an HTTP error."""
+
+    def __init__(self, code: int, message: str):
+        super().__init__(f"Error ({code}): {message}")
+        self.code = code
+        self.message = message
+
+
+def synapse_request(
+    method: str, endpoint: str, config: dict, body: dict | None = None, raise_errors: bool = False,
+    timeout: float = 10,
+) -> dict:
+    """Call the Synapse admin API. Exits on error unless raise_errors is set."""
     url = config["server_url"].rstrip("/") + endpoint
     headers = {
         "Authorization": f"Bearer {config['access_token']}",
@@ -35,7 +51,7 @@ def synapse_request(method: str, endpoint: str, config: dict, body: dict | None
     data = json.dumps(body).encode() if body is not None else None
     req = urllib.request.Request(url, data=data, headers=headers, method=method)
     try:
-        with urllib.request.urlopen(req, timeout=10) as resp:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
             return json.loads(resp.read().decode())
     except urllib.error.HTTPError as e:
         raw = e.read().decode()
@@ -44,23 +60,56 @@ def synapse_request(method: str, endpoint: str, config: dict, body: dict | None
             msg = err.get("error", raw)
         except Exception:
             msg = raw
+        if raise_errors:
+            raise SynapseError(e.code, msg) from None
         print(f"Error ({e.code}): {msg}", file=sys.stderr)
         sys.exit(1)
 
 
-def parse_duration(duration_str: str) -> int:
-    """Parse e.g. '7d', '1h', '2w' → expiry timestamp in milliseconds."""
-    units = {"h": "hours", "d": "days", "w": "weeks"}
+def synapse_paginate(
+    endpoint: str, config: dict, key: str, params: dict | None = None, page_size: int = 100
+) -> Iterator[dict]:
+    """Yield rows from a paginated admin API list, one page at a time.
+
+    Follows `next_token` / `next_batch`, fetching the next page in the
+    background while the caller consumes the current one. Stops fetching
+    as soon as the caller stops iterating.
+    """
+    base = dict(params or {}, limit=page_size)
+
+    def fetch(token) -> dict:
+        query = dict(base, **({"from": token} if token is not None else {}))
+        return synapse_request("GET", f"{endpoint}?{urllib.parse.urlencode(query)}", config)
+
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        page = fetch(None)
+        while True:
+            token = page.get("next_token", page.get("next_batch"))
+            pending = pool.submit(fetch, token) if token is not None else None
+            yield from page.get(key, [])
+            if pending is None:
+                return
+            page = pending.result()
+
+
+def parse_duration(duration_str: str, past: bool = False) -> int:
+    """Parse e.g. '7d', '1h', '2w' → expiry timestamp in milliseconds.
+
+    With past=True, returns the timestamp that long ago instead (for
+    "older than" / "before" arguments).
+    """
+    units = {"m": "minutes", "h": "hours", "d": "days", "w": "weeks"}
     suffix = duration_str[-1]
     if suffix not in units:
-        print(f"Unknown duration unit '{suffix}'. Use h, d, or w.", file=sys.stderr)
+        print(f"Unknown duration unit '{suffix}'. Use m, h, d, or w.", file=sys.stderr)
         sys.exit(1)
     try:
         value = int(duration_str[:-1])
     except ValueError:
         print(f"Invalid duration: {duration_str}", file=sys.stderr)
         sys.exit(1)
-    expiry = datetime.now() + timedelta(**{units[suffix]: value})
+    delta = timedelta(**{units[suffix]: value})
+    expiry = datetime.now() - delta if past else datetime.now() + delta
     return int(expiry.timestamp() * 1000)
 
 
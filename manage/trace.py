@@ -0,0 +1,138 @@
+"""Span tracing for `manage.py --trace` in Chrome trace-event format.
+
+Tracing is off unless `enable()` is called; `span()` is then a cheap no-op.
+Load the output file in chrome://tracing or https://ui.perfetto.dev.
+"""
+
+import functools
+import json
+import os
+import threading
+import time
+import urllib.request
+from contextlib import contextmanager
+
+_enabled = False
+_events: list[dict] = []
+_lock = threading.Lock()
+_root: dict | None = None
+
+
+def _now_us() -> float:
+    return time.perf_counter_ns() / 1000
+
+
+@contextmanager
+def span(name: str, cat: str = "manage", **args):
+    """Record the enclosed block as a complete ("X") trace event."""
+    if not _enabled:
+        yield
+        return
+    start = _now_us()
+    try:
+        yield
+    finally:
+        event = {
+            "name": name,
+            "cat": cat,
+            "ph": "X",
+            "ts": start,
+            "dur": _now_us() - start,
+            "pid": os.getpid(),
+            "tid": threading.get_ident(),
+        }
+        if args:
+            event["args"] = args
+        with _lock:
+            _events.append(event)
+
+
+def traced(name: str, cat: str = "wait"):
+    """Decorator form of `span()` for whole functions (e.g. polling loops)."""
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(name, cat):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def command_label(cmd: list[str] | str) -> str:
+    """Short span name for a subprocess command line."""
+    if isinstance(cmd, str):
+        return cmd[:60]
+    return " ".join(cmd[:4])
+
+
+class _TracingHTTPHandler(urllib.request.HTTPHandler):
+    def http_open(self, req):
+        with span(f"{req.get_method()} {req.full_url}", "http"):
+            return super().http_open(req)
+
+
+class _TracingHTTPSHandler(urllib.request.HTTPSHandler):
+    def https_open(self, req):
+        with span(f"{req.get_method()} {req.full_url}", "http"):
+            return super().https_open(req)
+
+
+def enable(name: str) -> None:
+    """Start tracing; every urllib request is traced from here on."""
+    global _enabled, _root
+    _enabled = True
+    _root = {"name": name, "start": _now_us(), "tid": threading.get_ident()}
+    urllib.request.install_opener(
+        urllib.request.build_opener(_TracingHTTPHandler, _TracingHTTPSHandler)
+    )
+
+
+def self_times(events: list[dict]) -> list[tuple[str, str, float]]:
+    """(name, cat, self time in µs) for each event: its duration minus its direct children."""
+    result = []
+    by_tid: dict = {}
+    for event in events:
+        by_tid.setdefault(event["tid"], []).append(event)
+    for tid_events in by_tid.values():
+        tid_events.sort(key=lambda e: (e["ts"], -e["dur"]))
+        stack: list[list] = []  # [event, child time]
+        for event in tid_events + [None]:
+            while stack and (event is None or event["ts"] >= stack[-1][0]["ts"] + stack[-1][0]["dur"]):
+                done, child = stack.pop()
+                result.append((done["name"], done["cat"], done["dur"] - child))
+                if stack:
+                    stack[-1][1] += done["dur"]
+            if event is not None:
+                stack.append([event, 0.0])
+    return result
+
+
+def finish(path: str | None, summary: int | None) -> None:
+    """Write the trace file and/or print the top spans by self time."""
+    if not _enabled:
+        return
+    with _lock:
+        events = list(_events)
+    if _root:
+        events.append({
+            "name": _root["name"], "cat": "command", "ph": "X",
+            "ts": _root["start"], "dur": _now_us() - _root["start"],
+            "pid": os.getpid(), "tid": _root["tid"],
+        })
+
+    if path:
+        with open(path, "w") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
+        print(f"\nTrace written to {path} ({len(events)} spans)")
+
+    if summary:
+        totals: dict = {}
+        for name, cat, self_us in self_times(events):
+            entry = totals.setdefault((cat, name), [0, 0.0])
+            entry[0] += 1
+            entry[1] += self_us
+        rows = sorted(totals.items(), key=lambda kv: kv[1][1], reverse=True)
+        print(f"\n--- Top {summary} spans by self time ---")
+        print(f"{'SELF':>10} {'CALLS':>6}  {'CAT':<11} NAME")
+        for (cat, name), (calls, self_us) in rows[:summary]:
+            print(f"{self_us / 1000:>8.1f}ms {calls:>6}  {cat:<11} {name[:70]}")
@@ -1,4 +1,4 @@
-"""Tunnel management: restart, url, publish."""
+"""Tunnel management: restart, url, bench, publish."""
 
 import json
 import os
@@ -7,13 +7,21 @@ import sys
 import time
 from pathlib import Path
 
+from manage import trace
+
 TUNNEL_URL_FILE = Path(__file__).parent.parent / "runtime" / "tunnel-url"
 TUNNEL_WAIT_SECONDS = 60
 TUNNEL_POLL_INTERVAL = 2
+PUBLISH_HISTORY_FILE = Path(__file__).parent.parent / "runtime" / "publish-history.jsonl"
+PAGES_WAIT_SECONDS = 900
+PAGES_BACKOFF_INITIAL = 2
+PAGES_BACKOFF_MAX = 30
+DEPLOY_WORKFLOW = "deploy-pages.yml"
 
 
 def _run(args: list[str], **kwargs) -> subprocess.CompletedProcess:
-    return subprocess.run(args, **kwargs)
+    with trace.span(trace.command_label(args), "subprocess"):
+        return subprocess.run(args, **kwargs)
 
 
 def _read_tunnel_url() -> str | None:
@@ -25,6 +33,7 @@ def _read_tunnel_url() -> str | None:
         return None
 
 
+@trace.traced("wait for new tunnel URL")
 def _wait_for_new_url(previous: str | None) -> str | None:
     """Wait for a URL that is different from `previous`."""
     deadline = time.time() + TUNNEL_WAIT_SECONDS
@@ -45,6 +54,9 @@ def cmd_tunnel(args) -> None:
         _tunnel_restart(args)
     elif args.tunnel_cmd == "url":
         _tunnel_url(args)
+    elif args.tunnel_cmd == "bench":
+        from manage.bench import cmd_bench
+        cmd_bench(args)
     else:
         print(f"Unknown tunnel subcommand: {args.tunnel_cmd}", file=sys.stderr)
         sys.exit(1)
@@ -132,11 +144,18 @@ def cmd_publish(args) -> None:
     github_repo = env["GITHUB_REPO"]
     node_name = env["NODE_NAME"]
 
-    _publish_url(url, github_token, github_repo, node_name)
+    started = time.time()
+    commit_sha = _publish_url(url, github_token, github_repo, node_name)
+
+    if getattr(args, "wait", False):
+        _wait_for_pages(url, commit_sha, github_token, github_repo, started)
 
 
-def _publish_url(url: str, github_token: str, github_repo: str, node_name: str) -> None:
-    """Write server.json locally and PUT to GitHub Contents API."""
+def _publish_url(url: str, github_token: str, github_repo: str, node_name: str) -> str | None:
+    """Write server.json locally and PUT to GitHub Contents API.
+
+    Returns the SHA of the commit the PUT created, if GitHub reported one.
+    """
     import base64
     import urllib.request
     import urllib.error
@@ -168,6 +187,16 @@ def _publish_url(url: str, github_token: str, github_repo: str, node_name: str)
         with urllib.request.urlopen(req, timeout=10) as resp:
             existing = json.loads(resp.read().decode())
             sha = existing.get("sha")
+            # Keep the gossip public key tunnel-watcher published
+            try:
+                published = json.loads(base64.b64decode(existing.get("content", "")) or b"{}")
+            except ValueError:
+                published = {}
+            if published.get("key"):
+                data["key"] = published["key"]
+                content_str = json.dumps(data, indent=2) + "\n"
+                content_b64 = base64.b64encode(content_str.encode()).decode()
+                server_json_path.write_text(content_str)
     except urllib.error.HTTPError as e:
         if e.code != 404:
             print(f"WARNING: Could not fetch existing server.json SHA: {e}", file=sys.stderr)
@@ -181,7 +210,162 @@ def _publish_url(url: str, github_token: str, github_repo: str, node_name: str)
     req = urllib.request.Request(api_url, data=body, headers=headers, method="PUT")
     try:
         with urllib.request.urlopen(req, timeout=10) as resp:
+            result = json.loads(resp.read().decode())
             print(f"Published to GitHub: {url}")
     except urllib.error.HTTPError as e:
         print(f"ERROR: GitHub API returned {e.code}: {e.read().decode()[:200]}", file=sys.stderr)
         sys.exit(1)
+    return (result.get("commit") or {}).get("sha")
+
+
+def _github_get(path: str, github_token: str) -> dict | None:
+    """GET a GitHub REST API path; None on any error."""
+    import urllib.request
+
+    req = urllib.request.Request(
+        f"https://api.github.com/{path}",
+        headers={
+            "Authorization": f"Bearer {github_token}",
+            "Accept": "application/vnd.github+json",
+            "X-GitHub-Api-Version": "2022-11-28",
+        },
+    )
+    try:
+        with urllib.request.urlopen(req, timeout=10) as resp:
+            return json.loads(resp.read().decode())
+    except Exception:
+        return None
+
+
+def _fetch_fresh(url: str) -> dict | None:
+    """GET a Pages JSON file, bypassing browser/CDN caches."""
+    import urllib.request
+
+    busted = f"{url}?_={int(time.time() * 1000)}"
+    req = urllib.request.Request(
+        busted,
+        headers={
+            "User-Agent": "manage.py/1.0",
+            "Cache-Control": "no-cache",
+            "Pragma": "no-cache",
+        },
+    )
+    try:
+        with urllib.request.urlopen(req, timeout=10) as resp:
+            return json.loads(resp.read().decode())
+    except Exception:
+        return None
+
+
+def _iso_to_epoch(value: str | None) -> float | None:
+    if not value:
+        return None
+    from datetime import datetime
+    return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+
+
+@trace.traced("wait for Pages propagation")
+def _wait_for_pages(url: str, commit_sha: str | None, github_token: str, github_repo: str, started: float) -> None:
+    """Follow the deploy workflow and poll Pages until it serves `url`.
+
+    Prints a timeline relative to the start of the publish and appends it
+    to runtime/publish-history.jsonl.
+    """
+    owner, repo = github_repo.split("/")
+    pages = f"https://{owner.lower()}.github.io/{repo}"
+    timeline: dict = {"put_accepted": round(time.time() - started, 2)}
+
+    def mark(key: str, label: str, at: float | None = None) -> None:
+        if timeline.get(key) is None:
+            timeline[key] = round((at or time.time()) - started, 2)
+            print(f"  +{timeline[key]:6.1f}s  {label}")
+
+    print(f"Waiting for GitHub Pages to serve {url} (up to {PAGES_WAIT_SECONDS}s)...")
+    print(f"  +{timeline['put_accepted']:6.1f}s  PUT accepted (commit {(commit_sha or '?')[:7]})")
+
+    checks = {
+        "server_json_fresh": (f"{pages}/server.json", lambda d: d.get("url") == url),
+        "config_json_fresh": (
+            f"{pages}/config.json",
+            lambda d: d.get("default_server_config", {}).get("m.homeserver", {}).get("base_url") == url,
+        ),
+    }
+    conclusion = None
+    deadline = time.time() + PAGES_WAIT_SECONDS
+    delay = PAGES_BACKOFF_INITIAL
+
+    while time.time() < deadline:
+        if commit_sha and conclusion is None:
+            data = _github_get(
+                f"repos/{github_repo}/actions/workflows/{DEPLOY_WORKFLOW}/runs?head_sha={commit_sha}",
+                github_token,
+            )
+            runs = (data or {}).get("workflow_runs", [])
+            if runs:
+                run = runs[0]
+                if run.get("status") in ("in_progress", "completed"):
+                    mark("workflow_started", f"workflow run {run['id']} started",
+                         _iso_to_epoch(run.get("run_started_at")))
+                if run.get("status") == "completed":
+                    conclusion = run.get("conclusion")
+                    mark("workflow_finished", f"workflow run {run['id']} finished: {conclusion}",
+                         _iso_to_epoch(run.get("updated_at")))
+                    if conclusion == "cancelled":
+                        print("  (run was cancelled by a newer deploy; still watching Pages)")
+                    elif conclusion != "success":
+                        print(f"ERROR: deploy workflow concluded {conclusion}", file=sys.stderr)
+                        break
+
+        for key, (file_url, is_fresh) in checks.items():
+            if timeline.get(key) is None:
+                data = _fetch_fresh(file_url)
+                if data is not None and is_fresh(data):
+                    mark(key, f"first fresh {file_url.rsplit('/', 1)[-1]}")
+
+        if all(timeline.get(key) is not None for key in checks):
+            break
+        time.sleep(delay)
+        delay = min(delay * 2, PAGES_BACKOFF_MAX)
+    else:
+        print(f"WARNING: Pages not serving {url} after {PAGES_WAIT_SECONDS}s", file=sys.stderr)
+
+    fresh = [timeline.get(key) for key in checks]
+    propagated = max(fresh) if None not in fresh else None
+    _record_publish(url, commit_sha, conclusion, propagated, timeline)
+
+
+def _record_publish(url: str, commit_sha: str | None, conclusion: str | None,
+                    propagated: float | None, timeline: dict) -> None:
+    """Append a publish measurement to the history and print propagation stats."""
+    from datetime import datetime
+    from manage.stats import fmt_seconds, percentile
+
+    entry = {
+        "at": datetime.now().isoformat(timespec="seconds"),
+        "url": url,
+        "commit": commit_sha,
+        "conclusion": conclusion,
+        "propagated": propagated,
+        **timeline,
+    }
+    PUBLISH_HISTORY_FILE.parent.mkdir(parents=True, exist_ok=True)
+    with PUBLISH_HISTORY_FILE.open("a") as f:
+        f.write(json.dumps(entry) + "\n")
+
+    samples = []
+    for line in PUBLISH_HISTORY_FILE.read_text().splitlines():
+        try:
+            value = json.loads(line).get("propagated")
+        except json.JSONDecodeError:
+            continue
+        if value is not None:
+            samples.append(value)
+
+    print()
+    print(f"Propagation: {fmt_seconds(propagated)}")
+    print(
+        f"History ({len(samples)} publishes): "
+        f"p50 {fmt_seconds(percentile(samples, 50))}  "
+        f"p95 {fmt_seconds(percentile(samples, 95))}  "
+        f"max {fmt_seconds(max(samples) if samples else None)}"
+    )
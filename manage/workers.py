@@ -0,0 +1,393 @@
+"""Synapse worker topology for `setup --workers N`.
+
+Generates, from pure functions so each piece can be checked on its own:
+
+  * data/workers/<name>.yaml        one config per worker
+  * homeserver.yaml settings        redis, instance_map, federation sender,
+                                    media worker, replication listener, Postgres
+  * router/workers.conf             nginx routing worker endpoints by path
+  * docker-compose.override.yml     redis, postgres and the worker services,
+                                    merged automatically by `docker compose`
+  * data/workers/postgres.env       the Postgres password, kept out of the override
+
+Workers need PostgreSQL, so an existing SQLite database is ported with
+synapse_port_db. data/homeserver.db is left in place as a fallback, but the
+SQLite-based commands (backup, restore, db, media audit attribution, purge
+event counts) detect the switch via backup.uses_postgres and stop using it.
+"""
+
+import secrets
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+from manage import trace
+
+REPO_ROOT = Path(__file__).parent.parent
+WORKERS_DIR = REPO_ROOT / "data" / "workers"
+ROUTER_CONF = REPO_ROOT / "router" / "workers.conf"
+COMPOSE_OVERRIDE = REPO_ROOT / "docker-compose.override.yml"
+PASSWORD_FILE = WORKERS_DIR / "postgres-password"
+POSTGRES_ENV_FILE = WORKERS_DIR / "postgres.env"
+
+WORKER_PORT = 8083
+REPLICATION_PORT = 9093
+LOG_CONFIG = "/data/localhost.log.config"
+SYNAPSE_IMAGE = "matrixdotorg/synapse:latest"
+
+# Endpoints a generic_worker can serve, from Synapse's workers documentation.
+# /sync and friends are hashed on the access token so a user's long-polls
+# keep hitting the same worker's caches.
+SYNC_PATTERNS = [
+    r"^/_matrix/client/(r0|v3)/sync$",
+    r"^/_matrix/client/(api/v1|r0|v3)/events$",
+    r"^/_matrix/client/(api/v1|r0|v3)/initialSync$",
+    r"^/_matrix/client/(api/v1|r0|v3)/rooms/[^/]+/initialSync$",
+]
+GENERIC_PATTERNS = [
+    r"^/_matrix/federation/v1/(event|state|state_ids|backfill|get_missing_events|event_auth)/",
+    r"^/_matrix/federation/v1/(publicRooms|query/|make_join/|make_leave/|user/devices/|hierarchy/|send/)",
+    r"^/_matrix/federation/(v1|v2)/(send_join|send_leave|invite)/",
+    r"^/_matrix/key/v2/query",
+    r"^/_matrix/client/(api/v1|r0|v3|unstable)/(createRoom|publicRooms|joined_rooms|search)$",
+    r"^/_matrix/client/(api/v1|r0|v3|unstable)/rooms/.*/(joined_members|members|state|context/.*|event/.*|messages)$",
+    r"^/_matrix/client/(v1|unstable)/rooms/.*/(relations/|threads$|hierarchy$)",
+    r"^/_matrix/client/(api/v1|r0|v3|unstable)/rooms/.*/(send|state/|redact)",
+    r"^/_matrix/client/(api/v1|r0|v3|unstable)/rooms/.*/(join|invite|leave|ban|unban|kick)$",
+    r"^/_matrix/client/(api/v1|r0|v3|unstable)/(join|knock|profile)/",
+    r"^/_matrix/client/(r0|v3|unstable)/keys/(query|changes|claim)$",
+    r"^/_matrix/client/(r0|v3|unstable)/(capabilities|account/whoami|devices)$",
+    r"^/_matrix/client/versions$",
+]
+MEDIA_PATTERNS = [
+    r"^/_matrix/(media|client/v1/media|federation/v1/media)/",
+    r"^/_synapse/admin/v1/(purge_media_cache|media/|quarantine_media/)",
+    r"^/_synapse/admin/v1/(room|user|users)/.*/media",
+]
+
+
+def worker_names(generic: int) -> list[tuple[str, str]]:
+    """(worker name, kind) for N generic workers plus one federation sender and one media worker."""
+    names = [(f"generic{i}", "generic") for i in range(1, generic + 1)]
+    return names + [("federation_sender1", "federation_sender"), ("media1", "media")]
+
+
+def worker_config(name: str, kind: str) -> str:
+    """Worker YAML. Everything runs synapse.app.generic_worker; the homeserver
+    config decides which one sends federation. The media worker turns the
+    media repo back on (it is off on the main process)."""
+    lines = [
+        "worker_app: synapse.app.generic_worker",
+        f"worker_name: {name}",
+        f"worker_log_config: {LOG_CONFIG}",
+    ]
+    if kind == "media":
+        lines.append("enable_media_repo: true")
+    resources = {"generic": "[client, federation]", "media": "[media]"}.get(kind)
+    if resources:
+        lines += [
+            "worker_listeners:",
+            "  - type: http",
+            f"    port: {WORKER_PORT}",
+            "    bind_addresses: ['0.0.0.0']",
+            "    resources:",
+            f"      - names: {resources}",
+        ]
+    return "\n".join(lines) + "\n"
+
+
+def database_settings(password: str) -> dict:
+    return {
+        "database": {
+            "name": "psycopg2",
+            "args": {
+                "user": "synapse",
+                "password": password,
+                "dbname": "synapse",
+                "host": "postgres",
+                "cp_min": 5,
+                "cp_max": 10,
+            },
+        },
+    }
+
+
+def homeserver_settings(workers: list[tuple[str, str]], password: str) -> dict:
+    """Top-level homeserver.yaml keys for `merge_settings`."""
+    return {
+        **database_settings(password),
+        "redis": {"enabled": True, "host": "redis", "port": 6379},
+        "instance_map": {"main": {"host": "synapse", "port": REPLICATION_PORT}},
+        "federation_sender_instances": [n for n, kind in workers if kind == "federation_sender"],
+        "enable_media_repo": False,
+        "media_instance_running_background_jobs": next(n for n, kind in workers if kind == "media"),
+    }
+
+
+def add_replication_listener(content: str) -> str:
+    """Insert the main process's replication listener into `listeners:`."""
+    if "names: [replication]" in content:
+        return content
+    listener = (
+        f"  - port: {REPLICATION_PORT}\n"
+        "    type: http\n"
+        "    bind_addresses: ['0.0.0.0']\n"
+        "    resources:\n"
+        "      - names: [replication]\n"
+    )
+    if "\nlisteners:\n" not in content:
+        raise ValueError("no `listeners:` block in homeserver.yaml")
+    return content.replace("\nlisteners:\n", "\nlisteners:\n" + listener, 1)
+
+
+def _container(name: str) -> str:
+    return f"synapse-{name.replace('_', '-')}"
+
+
+def router_conf(workers: list[tuple[str, str]]) -> str:
+    """nginx config for the router: media and generic endpoints to workers, the rest to main.
+
+    The media cache snippet (router/media-cache.conf) proxies to the
+    synapse_media and synapse_client upstreams defined here.
+    """
+    generic = [_container(n) for n, kind in workers if kind == "generic"]
+    media = [_container(n) for n, kind in workers if kind == "media"]
+
+    def upstream(name: str, hosts: list[str], balance: str = "") -> list[str]:
+        return [f"upstream {name} {{"] + ([f"    {balance}"] if balance else []) + [
+            f"    server {host}:{WORKER_PORT};" for host in hosts
+        ] + ["}", ""]
+
+    def location(patterns: list[str], upstream_name: str) -> list[str]:
+        return [
+            f"    location ~ {'|'.join(f'({p})' for p in patterns)} {{",
+            f"        proxy_pass http://{upstream_name};",
+            "    }",
+            "",
+        ]
+
+    lines = [
+        "# Generated by ./manage.py setup --workers; edit manage/workers.py instead.",
+        "# cloudflared -> router -> synapse workers / main / tunnel-watcher.",
+        "",
+        "upstream synapse_main {",
+        "    server synapse:8008;",
+        "}",
+        "",
+        *upstream("synapse_sync", generic, "hash $http_authorization consistent;"),
+        *upstream("synapse_client", generic, "least_conn;"),
+        *upstream("synapse_media", media),
+        "server {",
+        "    listen 8000;",
+        "",
+        "    # Must be at least Synapse's max_upload_size (see setup --profile).",
+        "    client_max_body_size 100M;",
+        "",
+        "    proxy_http_version 1.1;",
+        "    proxy_set_header Host $host;",
+        "    proxy_set_header X-Forwarded-For $proxy_add_x_forwarded_for;",
+        "    proxy_set_header X-Forwarded-Proto https;",
+        "    proxy_read_timeout 120s;",
+        "",
+        "    access_log /var/log/nginx/access.log frederick;",
+        "",
+        "    # Docker's DNS, so nginx starts before tunnel-watcher exists.",
+        "    resolver 127.0.0.11 valid=10s;",
+        "",
+        "    # Peer URL gossip (tunnel-watcher/gossip.py)",
+        "    location /_frederick/ {",
+        "        set $gossip http://tunnel-watcher:8090;",
+        "        proxy_pass $gossip;",
+        "    }",
+        "",
+        "    include /etc/nginx/conf.d/snippets/media-cache.conf;",
+        "",
+        *location(MEDIA_PATTERNS, "synapse_media"),
+        *location(SYNC_PATTERNS, "synapse_sync"),
+        *location(GENERIC_PATTERNS, "synapse_client"),
+        "    location / {",
+        "        proxy_pass http://synapse_main;",
+        "    }",
+        "}",
+    ]
+    return "\n".join(lines) + "\n"
+
+
+def compose_override(workers: list[tuple[str, str]]) -> str:
+    """docker-compose.override.yml adding redis, postgres and the workers.
+
+    The router takes over host port 8008 so local clients also reach the
+    workers (main no longer serves media); `!override` needs Compose 2.24+.
+    The Postgres password is read from data/workers/postgres.env, so this
+    file holds no credentials.
+    """
+    containers = [_container(n) for n, _ in workers]
+    lines = [
+        "# Generated by ./manage.py setup --workers; re-run it to change the topology.",
+        "services:",
+        "  synapse:",
+        "    ports: !override",
+        '      - "127.0.0.1:9000:9000"',
+        "    depends_on:",
+        "      - redis",
+        "      - postgres",
+        "",
+        "  router:",
+        "    volumes: !override",
+        "      - ./router/workers.conf:/etc/nginx/conf.d/default.conf:ro",
+        "      - ./router/cache-zone.conf:/etc/nginx/templates/cache-zone.conf.template:ro",
+        "      - ./router/media-cache.conf:/etc/nginx/templates/snippets/media-cache.conf.template:ro",
+        "      - router-cache:/var/cache/nginx/frederick",
+        "    ports:",
+        '      - "8008:8000"',
+        "    depends_on:",
+        *[f"      - {c}" for c in containers],
+        "",
+        "  redis:",
+        "    image: redis:7-alpine",
+        "    container_name: redis",
+        "    restart: unless-stopped",
+        "",
+        "  postgres:",
+        "    image: postgres:16-alpine",
+        "    container_name: postgres",
+        "    env_file:",
+        f"      - ./{POSTGRES_ENV_FILE.relative_to(REPO_ROOT).as_posix()}",
+        "    environment:",
+        "      - POSTGRES_USER=synapse",
+        "      - POSTGRES_DB=synapse",
+        "      - POSTGRES_INITDB_ARGS=--encoding=UTF-8 --lc-collate=C --lc-ctype=C",
+        "    volumes:",
+        "      - postgres-data:/var/lib/postgresql/data",
+        "    healthcheck:",
+        '      test: ["CMD", "pg_isready", "-U", "synapse"]',
+        "      interval: 5s",
+        "      timeout: 5s",
+        "      retries: 10",
+        "    restart: unless-stopped",
+    ]
+    for (name, _), container in zip(workers, containers):
+        lines += [
+            "",
+            f"  {container}:",
+            f"    image: {SYNAPSE_IMAGE}",
+            f"    container_name: {container}",
+            "    entrypoint:",
+            '      - "/start.py"',
+            '      - "run"',
+            '      - "--config-path=/data/homeserver.yaml"',
+            f'      - "--config-path=/data/workers/{name}.yaml"',
+            "    environment:",
+            "      - UID=1000",
+            "      - GID=1000",
+            "      - SYNAPSE_WORKER=synapse.app.generic_worker",
+            "    volumes:",
+            "      - ./data:/data",
+            "    depends_on:",
+            "      - synapse",
+            "    restart: unless-stopped",
+        ]
+    lines += ["", "volumes:", "  postgres-data:"]
+    return "\n".join(lines) + "\n"
+
+
+def _postgres_password() -> str:
+    if PASSWORD_FILE.exists():
+        return PASSWORD_FILE.read_text().strip()
+    PASSWORD_FILE.parent.mkdir(parents=True, exist_ok=True)
+    password = secrets.token_urlsafe(24)
+    PASSWORD_FILE.write_text(password + "\n")
+    PASSWORD_FILE.chmod(0o600)
+    return password
+
+
+def _write_postgres_env(password: str) -> None:
+    POSTGRES_ENV_FILE.write_text(f"POSTGRES_PASSWORD={password}\n")
+    POSTGRES_ENV_FILE.chmod(0o600)
+
+
+def _run(args: list[str], **kwargs) -> subprocess.CompletedProcess:
+    with trace.span(trace.command_label(args), "subprocess"):
+        return subprocess.run(args, cwd=REPO_ROOT, **kwargs)
+
+
+def _port_sqlite(password: str) -> None:
+    """Copy data/homeserver.db into Postgres with synapse_port_db."""
+    from manage.setup import merge_settings
+
+    (WORKERS_DIR / "postgres.yaml").write_text(merge_settings("", database_settings(password)))
+
+    print("  Stopping synapse and starting postgres...")
+    _run(["docker", "compose", "stop", "synapse"])
+    if _run(["docker", "compose", "up", "-d", "postgres"]).returncode != 0:
+        print("ERROR: could not start postgres", file=sys.stderr)
+        sys.exit(1)
+    with trace.span("wait for postgres", "wait"):
+        for _ in range(30):
+            if _run(["docker", "compose", "exec", "-T", "postgres", "pg_isready", "-U", "synapse"],
+                    capture_output=True).returncode == 0:
+                break
+            time.sleep(2)
+        else:
+            print("ERROR: postgres did not become ready", file=sys.stderr)
+            sys.exit(1)
+
+    print("  Porting data/homeserver.db to postgres (synapse_port_db)...")
+    result = _run([
+        "docker", "compose", "run", "--rm", "--no-deps", "--entrypoint", "synapse_port_db", "synapse",
+        "--sqlite-database", "/data/homeserver.db",
+        "--postgres-config", "/data/workers/postgres.yaml",
+    ])
+    if result.returncode != 0:
+        print("ERROR: synapse_port_db failed; homeserver.yaml was not changed.", file=sys.stderr)
+        sys.exit(result.returncode)
+
+
+def configure_workers(generic: int) -> None:
+    """Write worker configs, router and compose override; switch Synapse to Postgres."""
+    from manage.setup import merge_settings
+
+    if generic < 1:
+        print("ERROR: --workers must be at least 1", file=sys.stderr)
+        sys.exit(1)
+    homeserver_yaml = REPO_ROOT / "data" / "homeserver.yaml"
+    if not homeserver_yaml.exists():
+        print("ERROR: Run `./manage.py setup` or `synapse generate` first.", file=sys.stderr)
+        sys.exit(1)
+
+    workers = worker_names(generic)
+    password = _postgres_password()
+    WORKERS_DIR.mkdir(parents=True, exist_ok=True)
+    for stale in WORKERS_DIR.glob("*.yaml"):
+        if stale.name != "postgres.yaml":
+            stale.unlink()
+    for name, kind in workers:
+        (WORKERS_DIR / f"{name}.yaml").write_text(worker_config(name, kind))
+    _write_postgres_env(password)
+    ROUTER_CONF.write_text(router_conf(workers))
+    COMPOSE_OVERRIDE.write_text(compose_override(workers))
+    print(f"  Workers: {', '.join(n for n, _ in workers)}")
+    print(f"  Wrote data/workers/, {ROUTER_CONF.relative_to(REPO_ROOT)}, {COMPOSE_OVERRIDE.name}")
+
+    content = homeserver_yaml.read_text()
+    if "name: sqlite3" in content and (REPO_ROOT / "data" / "homeserver.db").exists():
+        _port_sqlite(password)
+        print("  Note: data/homeserver.db is now stale; `backup`, `restore` and `db` refuse to use it.")
+    try:
+        updated = add_replication_listener(merge_settings(content, homeserver_settings(workers, password)))
+    except ValueError as e:
+        print(f"ERROR: {e}", file=sys.stderr)
+        sys.exit(1)
+    homeserver_yaml.write_text(updated)
+    print("  homeserver.yaml: postgres, redis, instance_map, federation sender, media worker")
+
+    try:
+        result = _run(["docker", "compose", "config", "--quiet"], capture_output=True, text=True)
+    except FileNotFoundError:
+        print("  docker not found; skipped validating the compose override.")
+        return
+    if result.returncode != 0:
+        print(f"ERROR: docker compose rejected the generated override:\n{result.stderr}", file=sys.stderr)
+        sys.exit(1)
+    print("  docker compose config: OK")
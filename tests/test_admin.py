@@ -0,0 +1,27 @@
+"""Room spec loading for `rooms apply`."""
+
+import json
+
+import pytest
+
+from manage import admin
+
+
+def test_load_spec_json(tmp_path):
+    spec = tmp_path / "rooms.json"
+    spec.write_text(json.dumps({"rooms": [{"alias": "general", "join_rule": "public"}]}))
+    assert admin._load_spec(str(spec)) == [{"alias": "general", "join_rule": "public"}]
+
+
+def test_load_spec_requires_alias(tmp_path):
+    spec = tmp_path / "rooms.json"
+    spec.write_text(json.dumps({"rooms": [{"name": "No alias"}]}))
+    with pytest.raises(SystemExit):
+        admin._load_spec(str(spec))
+
+
+def test_load_spec_rejects_bad_json(tmp_path):
+    spec = tmp_path / "rooms.json"
+    spec.write_text("{rooms: [")
+    with pytest.raises(SystemExit):
+        admin._load_spec(str(spec))
@@ -0,0 +1,67 @@
+"""Registration UIA stage walk in the load test."""
+
+import pytest
+
+from manage import loadtest
+
+TOKEN = "m.login.registration_token"
+DUMMY = "m.login.dummy"
+
+
+class FakeClient:
+    """Plays a Synapse /register endpoint offering `flows`; records the auth dicts it receives."""
+
+    def __init__(self, flows: list[dict]):
+        self.flows = flows
+        self.completed: list[str] = []
+        self.auths: list[dict] = []
+
+    def request(self, method, path, body=None, token=None):
+        auth = body.get("auth")
+        if auth:
+            self.auths.append(auth)
+            self.completed.append(auth["type"])
+        for flow in self.flows:
+            if set(flow["stages"]) <= set(self.completed):
+                return 200, {"user_id": f"@{body['username']}:test", "access_token": "tok"}
+        return 401, {"flows": self.flows, "completed": self.completed, "session": "sess"}
+
+
+@pytest.mark.parametrize(
+    "flows, completed, expected",
+    [
+        ([{"stages": [DUMMY]}], [], DUMMY),
+        ([{"stages": [TOKEN, DUMMY]}], [], TOKEN),
+        ([{"stages": [TOKEN, DUMMY]}], [TOKEN], DUMMY),
+        ([{"stages": [DUMMY]}, {"stages": [TOKEN]}], [], TOKEN),
+        ([{"stages": ["m.login.recaptcha", DUMMY]}], [], None),
+        ([{"stages": ["m.login.email.identity"]}, {"stages": [DUMMY]}], [], DUMMY),
+        ([], [], None),
+    ],
+)
+def test_next_stage(flows, completed, expected):
+    assert loadtest._next_stage(flows, completed) == expected
+
+
+def test_register_open_node_uses_dummy():
+    client = FakeClient([{"stages": [DUMMY]}])
+    data, _ = loadtest._register(client, "alice", "pw", "regtok")
+    assert data["user_id"] == "@alice:test"
+    assert client.auths == [{"type": DUMMY, "session": "sess"}]
+
+
+def test_register_token_node_sends_token():
+    client = FakeClient([{"stages": [TOKEN, DUMMY]}])
+    data, _ = loadtest._register(client, "bob", "pw", "regtok")
+    assert data is not None
+    assert client.auths == [
+        {"type": TOKEN, "session": "sess", "token": "regtok"},
+        {"type": DUMMY, "session": "sess"},
+    ]
+
+
+def test_register_unsupported_flow_fails():
+    client = FakeClient([{"stages": ["m.login.recaptcha"]}])
+    data, _ = loadtest._register(client, "carol", "pw", "regtok")
+    assert data is None
+    assert client.auths == []
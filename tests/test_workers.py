@@ -0,0 +1,138 @@
+"""Generated worker topology: worker YAML, homeserver settings, router and compose override."""
+
+import re
+
+import pytest
+
+from manage import workers
+from manage.setup import merge_settings
+
+TOPOLOGY = workers.worker_names(2)
+PASSWORD = "s3cret-password"
+
+LOCATION = re.compile(r"^    location ~ (?P<regex>.+) \{\n        proxy_pass http://(?P<upstream>\w+);", re.M)
+
+
+def route(conf: str, uri: str) -> str:
+    """The upstream nginx would pick for `uri`: first matching regex location, else `location /`."""
+    for m in LOCATION.finditer(conf):
+        if re.search(m["regex"], uri):
+            return m["upstream"]
+    return re.search(r"location / \{\n        proxy_pass http://(\w+);", conf)[1]
+
+
+def upstream_servers(conf: str, name: str) -> list[str]:
+    block = re.search(rf"upstream {name} \{{(.*?)\}}", conf, re.S)[1]
+    return re.findall(r"server (\S+);", block)
+
+
+def test_worker_names():
+    assert TOPOLOGY == [
+        ("generic1", "generic"),
+        ("generic2", "generic"),
+        ("federation_sender1", "federation_sender"),
+        ("media1", "media"),
+    ]
+
+
+def test_generic_worker_listens_for_client_and_federation():
+    config = workers.worker_config("generic1", "generic")
+    assert "worker_app: synapse.app.generic_worker" in config
+    assert "worker_name: generic1" in config
+    assert f"port: {workers.WORKER_PORT}" in config
+    assert "- names: [client, federation]" in config
+    assert "enable_media_repo" not in config
+
+
+def test_media_worker_serves_media():
+    config = workers.worker_config("media1", "media")
+    assert "- names: [media]" in config
+    assert "enable_media_repo: true" in config
+
+
+def test_federation_sender_has_no_listener():
+    config = workers.worker_config("federation_sender1", "federation_sender")
+    assert "worker_listeners" not in config
+
+
+def test_homeserver_settings():
+    settings = workers.homeserver_settings(TOPOLOGY, PASSWORD)
+    assert settings["instance_map"] == {"main": {"host": "synapse", "port": workers.REPLICATION_PORT}}
+    assert settings["federation_sender_instances"] == ["federation_sender1"]
+    assert settings["enable_media_repo"] is False
+    assert settings["media_instance_running_background_jobs"] == "media1"
+    assert settings["redis"] == {"enabled": True, "host": "redis", "port": 6379}
+    assert settings["database"]["name"] == "psycopg2"
+    assert settings["database"]["args"]["host"] == "postgres"
+    assert settings["database"]["args"]["password"] == PASSWORD
+
+
+def test_homeserver_settings_merge_is_idempotent():
+    content = "server_name: localhost\ndatabase:\n  name: sqlite3\n  args:\n    database: /data/homeserver.db\n"
+    once = merge_settings(content, workers.homeserver_settings(TOPOLOGY, PASSWORD))
+    assert "sqlite3" not in once
+    assert 'name: "psycopg2"' in once
+    assert merge_settings(once, workers.homeserver_settings(TOPOLOGY, PASSWORD)) == once
+
+
+def test_replication_listener():
+    content = "server_name: localhost\nlisteners:\n  - port: 8008\n    type: http\n"
+    updated = workers.add_replication_listener(content)
+    assert f"  - port: {workers.REPLICATION_PORT}\n" in updated
+    assert "      - names: [replication]\n" in updated
+    assert "  - port: 8008\n" in updated
+    assert workers.add_replication_listener(updated) == updated
+    with pytest.raises(ValueError):
+        workers.add_replication_listener("server_name: localhost\n")
+
+
+def test_router_upstreams():
+    conf = workers.router_conf(TOPOLOGY)
+    generic = [f"synapse-generic1:{workers.WORKER_PORT}", f"synapse-generic2:{workers.WORKER_PORT}"]
+    assert upstream_servers(conf, "synapse_main") == ["synapse:8008"]
+    assert upstream_servers(conf, "synapse_sync") == generic
+    assert upstream_servers(conf, "synapse_client") == generic
+    assert upstream_servers(conf, "synapse_media") == [f"synapse-media1:{workers.WORKER_PORT}"]
+    assert "hash $http_authorization consistent;" in conf
+    assert "federation-sender1" not in conf
+    assert "include /etc/nginx/conf.d/snippets/media-cache.conf;" in conf
+
+
+@pytest.mark.parametrize("uri, upstream", [
+    ("/_matrix/client/v3/sync", "synapse_sync"),
+    ("/_matrix/client/r0/rooms/!abc:localhost/initialSync", "synapse_sync"),
+    ("/_matrix/client/v3/account/whoami", "synapse_client"),
+    ("/_matrix/client/v3/rooms/!abc:localhost/send/m.room.message/t1", "synapse_client"),
+    ("/_matrix/client/v3/keys/query", "synapse_client"),
+    ("/_matrix/federation/v1/send/123", "synapse_client"),
+    ("/_matrix/media/v3/upload", "synapse_media"),
+    ("/_matrix/client/v1/media/download/localhost/abc", "synapse_media"),
+    ("/_synapse/admin/v1/purge_media_cache", "synapse_media"),
+    ("/_matrix/client/v3/login", "synapse_main"),
+    ("/_synapse/admin/v2/users/@a:localhost", "synapse_main"),
+])
+def test_router_routes(uri, upstream):
+    assert route(workers.router_conf(TOPOLOGY), uri) == upstream
+
+
+def test_compose_override():
+    override = workers.compose_override(TOPOLOGY)
+    assert PASSWORD not in override
+    assert "POSTGRES_PASSWORD" not in override
+    assert "      - ./data/workers/postgres.env\n" in override
+    assert "      - ./router/workers.conf:/etc/nginx/conf.d/default.conf:ro\n" in override
+    for name, _ in TOPOLOGY:
+        container = name.replace("_", "-")
+        assert f"  synapse-{container}:\n" in override
+        assert f'      - "--config-path=/data/workers/{name}.yaml"\n' in override
+        assert f"      - synapse-{container}\n" in override  # router depends_on
+
+
+def test_postgres_switch_is_detected(tmp_path):
+    from manage.backup import uses_postgres
+
+    config = tmp_path / "homeserver.yaml"
+    config.write_text("server_name: localhost\ndatabase:\n  name: sqlite3\n")
+    assert not uses_postgres(tmp_path)
+    config.write_text(merge_settings(config.read_text(), workers.homeserver_settings(TOPOLOGY, PASSWORD)))
+    assert uses_postgres(tmp_path)
@@ -0,0 +1,280 @@
+"""Peer URL gossip — spread signed server.json records over the tunnels.
+
+GitHub Pages takes minutes to reflect a new tunnel URL (Contents API
+commit, deploy workflow, CDN). Gossip gets it to peers in seconds:
+
+  * Each node signs {name, url, ts} with its own ed25519 key. The public
+    key is published in the node's server.json on Pages, which stays the
+    trust anchor and the cold-start fallback.
+  * On a URL change (and every GOSSIP_INTERVAL) a node POSTs every record
+    it knows to GOSSIP_PATH on each peer's last-known URL. The peer
+    replies with its own records (push-pull).
+  * A record is accepted only if it verifies against the key that node
+    publishes on Pages and is newer than what we hold; anything new is
+    passed on to our peers in turn. Each name is bound to the peers.json
+    entry that first published it, so one peer can't claim another's name
+    and sign URLs for it.
+
+Reads env vars:
+  GOSSIP_PORT      - port served through the tunnel router (default: 8090)
+  GOSSIP_KEY_FILE  - where this node's signing key lives (default: /runtime/gossip.key)
+  GOSSIP_INTERVAL  - seconds between anti-entropy rounds (default: 300)
+  PEERS_FILE       - peers.json listing peer Pages server.json URLs (default: /app/peers.json)
+"""
+
+import base64
+import json
+import logging
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+import requests
+from cryptography.exceptions import InvalidSignature
+from cryptography.hazmat.primitives.asymmetric.ed25519 import Ed25519PrivateKey, Ed25519PublicKey
+from cryptography.hazmat.primitives.serialization import Encoding, PublicFormat
+
+log = logging.getLogger(__name__)
+
+GOSSIP_PATH = "/_frederick/gossip"
+MAX_BODY = 64 * 1024
+KEY_REFRESH_MIN_SECONDS = 60
+
+
+def load_key(path: Path) -> Ed25519PrivateKey:
+    """Load this node's signing key, creating it on first start."""
+    if path.exists():
+        return Ed25519PrivateKey.from_private_bytes(base64.b64decode(path.read_text()))
+    key = Ed25519PrivateKey.generate()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(base64.b64encode(key.private_bytes_raw()).decode() + "\n")
+    path.chmod(0o600)
+    log.info("Generated gossip signing key at %s", path)
+    return key
+
+
+def public_key_b64(key: Ed25519PrivateKey) -> str:
+    raw = key.public_key().public_bytes(Encoding.Raw, PublicFormat.Raw)
+    return base64.b64encode(raw).decode()
+
+
+def _canonical(record: dict) -> bytes:
+    unsigned = {k: v for k, v in record.items() if k != "sig"}
+    return json.dumps(unsigned, sort_keys=True, separators=(",", ":")).encode()
+
+
+def sign_record(key: Ed25519PrivateKey, name: str, url: str) -> dict:
+    record = {"name": name, "url": url, "ts": int(time.time() * 1000)}
+    record["sig"] = base64.b64encode(key.sign(_canonical(record))).decode()
+    return record
+
+
+def verify_record(record: dict, public_key: str) -> bool:
+    try:
+        pub = Ed25519PublicKey.from_public_bytes(base64.b64decode(public_key))
+        pub.verify(base64.b64decode(record["sig"]), _canonical(record))
+        return True
+    except (InvalidSignature, KeyError, ValueError, TypeError):
+        return False
+
+
+class Gossip:
+    """Known peer records, plus the push/merge logic."""
+
+    def __init__(self, key: Ed25519PrivateKey, node_name: str, peers_file: Path):
+        self.key = key
+        self.node_name = node_name
+        self.peers_file = peers_file
+        self.records: dict[str, dict] = {}
+        self.keys: dict[str, str] = {}
+        self.seed_urls: dict[str, str] = {}
+        self.sources: dict[str, str] = {}  # name -> the Pages server.json URL it came from
+        self.keys_fetched_at = 0.0
+        self.lock = threading.Lock()
+
+    def refresh_peers(self) -> None:
+        """Learn peer names, public keys and cold-start URLs from their Pages server.json."""
+        with self.lock:
+            self.keys_fetched_at = time.time()
+        try:
+            pages_urls = json.loads(self.peers_file.read_text()).get("peers", [])
+        except (OSError, json.JSONDecodeError) as exc:
+            log.warning("Could not read %s: %s", self.peers_file, exc)
+            return
+        with self.lock:
+            # Peers removed from peers.json lose their name, key and records.
+            for name, source in list(self.sources.items()):
+                if source not in pages_urls:
+                    self._forget(name)
+        for pages_url in pages_urls:
+            try:
+                data = requests.get(pages_url, timeout=5).json()
+            except Exception as exc:
+                log.debug("Could not fetch %s: %s", pages_url, exc)
+                continue
+            name = data.get("name")
+            if not name or name == self.node_name:
+                continue
+            with self.lock:
+                owner = self.sources.get(name)
+                previous = next((n for n, src in self.sources.items() if src == pages_url and n != name), None)
+                if owner not in (None, pages_url):
+                    log.warning("Ignoring %s: name %r already belongs to %s", pages_url, name, owner)
+                    continue
+                if previous:
+                    log.warning(
+                        "Ignoring %s: it now claims %r but was %r (restart the watcher to accept a rename)",
+                        pages_url, name, previous,
+                    )
+                    continue
+                self.sources[name] = pages_url
+                if data.get("key"):
+                    self.keys[name] = data["key"]
+                if data.get("url"):
+                    self.seed_urls[name] = data["url"]
+
+    def _forget(self, name: str) -> None:
+        """Drop everything known about `name`. Caller holds the lock."""
+        for table in (self.sources, self.keys, self.seed_urls, self.records):
+            table.pop(name, None)
+
+    def refresh_peers_async(self) -> None:
+        """Refresh keys (then re-push) in the background, at most once per KEY_REFRESH_MIN_SECONDS.
+
+        Used from merge(), which runs on the unauthenticated POST handler,
+        so a stranger's records can't make requests wait on GitHub Pages.
+        """
+        with self.lock:
+            if time.time() - self.keys_fetched_at <= KEY_REFRESH_MIN_SECONDS:
+                return
+            self.keys_fetched_at = time.time()
+
+        def refresh_and_push() -> None:
+            self.refresh_peers()
+            self.push()  # picks up records from peers whose keys we just learned
+
+        threading.Thread(target=refresh_and_push, daemon=True).start()
+
+    def set_self(self, url: str) -> None:
+        """Sign our new URL and push it to every peer."""
+        with self.lock:
+            self.records[self.node_name] = sign_record(self.key, self.node_name, url)
+        self.push_async()
+
+    def merge(self, records: list) -> bool:
+        """Take records that verify and are newer than ours. True if anything changed.
+
+        Records signed by an unknown key are dropped and a key refresh is
+        scheduled; the peer's next push (or ours) brings them back.
+        """
+        with self.lock:
+            keys = dict(self.keys)
+        changed = False
+        for record in records[:256]:
+            if not isinstance(record, dict):
+                continue
+            name = record.get("name")
+            if not name or name == self.node_name:
+                continue
+            public_key = keys.get(name)
+            if not (public_key and verify_record(record, public_key)):
+                self.refresh_peers_async()
+                log.debug("Rejected gossip record for %s", name)
+                continue
+            with self.lock:
+                current = self.records.get(name)
+                if current and current.get("ts", 0) >= record.get("ts", 0):
+                    continue
+                self.records[name] = record
+            log.info("Gossip: %s is now at %s", name, record.get("url"))
+            changed = True
+        return changed
+
+    def snapshot(self) -> list[dict]:
+        with self.lock:
+            return list(self.records.values())
+
+    def targets(self) -> list[str]:
+        with self.lock:
+            names = set(self.keys) | set(self.seed_urls)
+            urls = [
+                (self.records.get(name) or {}).get("url") or self.seed_urls.get(name)
+                for name in names
+            ]
+        return [u for u in urls if u]
+
+    def push(self) -> None:
+        """Send all known records to each peer; merge what they send back."""
+        body = {"records": self.snapshot()}
+        changed = False
+        for url in self.targets():
+            try:
+                resp = requests.post(url.rstrip("/") + GOSSIP_PATH, json=body, timeout=5)
+                if resp.ok:
+                    changed |= self.merge(resp.json().get("records", []))
+            except Exception as exc:
+                log.debug("Gossip push to %s failed: %s", url, exc)
+        if changed:
+            self.push_async()
+
+    def push_async(self) -> None:
+        threading.Thread(target=self.push, daemon=True).start()
+
+    def anti_entropy(self, interval: int) -> None:
+        """Periodically refresh peer keys and re-push everything we know."""
+        while True:
+            time.sleep(interval)
+            self.refresh_peers()
+            self.push()
+
+    def serve(self, port: int) -> None:
+        gossip = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _reply(self, code: int, payload: dict) -> None:
+                data = json.dumps(payload).encode()
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Access-Control-Allow-Origin", "*")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                if self.path != GOSSIP_PATH:
+                    return self._reply(404, {"error": "not found"})
+                self._reply(200, {"records": gossip.snapshot()})
+
+            def do_POST(self):
+                if self.path != GOSSIP_PATH:
+                    return self._reply(404, {"error": "not found"})
+                length = int(self.headers.get("Content-Length") or 0)
+                if length > MAX_BODY:
+                    return self._reply(413, {"error": "too large"})
+                try:
+                    records = json.loads(self.rfile.read(length)).get("records", [])
+                except (json.JSONDecodeError, AttributeError):
+                    return self._reply(400, {"error": "bad json"})
+                if gossip.merge(records if isinstance(records, list) else []):
+                    gossip.push_async()
+                self._reply(200, {"records": gossip.snapshot()})
+
+            def log_message(self, format, *args):
+                log.debug("gossip: " + format, *args)
+
+        server = ThreadingHTTPServer(("0.0.0.0", port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        log.info("Gossip endpoint on :%s%s", port, GOSSIP_PATH)
+
+
+def start(node_name: str) -> Gossip:
+    """Create the gossip node from env vars and start its threads."""
+    key = load_key(Path(os.environ.get("GOSSIP_KEY_FILE", "/runtime/gossip.key")))
+    node = Gossip(key, node_name, Path(os.environ.get("PEERS_FILE", "/app/peers.json")))
+    node.refresh_peers()
+    node.serve(int(os.environ.get("GOSSIP_PORT", "8090")))
+    interval = int(os.environ.get("GOSSIP_INTERVAL", "300"))
+    threading.Thread(target=node.anti_entropy, args=(interval,), daemon=True).start()
+    return node
@@ -0,0 +1,383 @@
+#!/usr/bin/env python3
+"""Mesh-scale simulator for tunnel URL discovery.
+
+Starts N in-process nodes, each running watcher.py's real detect
+(`latest_tunnel_url`) and publish (`check_url` + `publish`) logic against a
+local fake GitHub, with fake cloudflared logs. Tunnel restarts are injected
+at random; the fake GitHub runs the Pages deploy workflow with its
+`cancel-in-progress` concurrency group. At the end it reports how long each
+URL change took to reach every peer, API calls per change, GitHub rate-limit
+headroom, cancelled deploys and the peers.json fetch fan-out.
+
+Peers are modelled as polling each other's server.json every --peer-poll
+seconds at a random phase, which is computed from the Pages history after
+the run rather than simulated request by request (N² fetches add nothing
+but load).
+
+Time is simulated: --speed 60 runs one simulated minute per real second.
+Real time spent in HTTP calls is scaled too, so lower --speed when a
+--storm makes hundreds of nodes publish at once.
+Run inside the tunnel-watcher image, which has watcher.py's dependencies:
+
+    docker compose run --rm --no-deps tunnel-watcher python simulate.py --nodes 50
+"""
+
+import argparse
+import base64
+import hashlib
+import json
+import logging
+import math
+import random
+import secrets
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import watcher
+
+GITHUB_RATE_LIMIT = 5000  # authenticated requests per token per hour
+LOG_TAIL = 100
+
+
+def percentile(values: list[float], pct: float) -> float | None:
+    """Nearest-rank percentile; None for no values."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(pct / 100 * len(ordered)) - 1)]
+
+
+def fmt(seconds: float | None) -> str:
+    return "-" if seconds is None else f"{seconds:.0f}s"
+
+
+class Clock:
+    """Simulated seconds since start, running `speed` times faster than real time."""
+
+    def __init__(self, speed: float):
+        self.speed = speed
+        self.started = time.monotonic()
+
+    def now(self) -> float:
+        return (time.monotonic() - self.started) * self.speed
+
+    def sleep(self, seconds: float) -> None:
+        time.sleep(max(0.0, seconds) / self.speed)
+
+    def sleep_until(self, at: float) -> None:
+        self.sleep(at - self.now())
+
+
+class FakeGitHub:
+    """Contents API for server.json plus a Pages deploy workflow per repo."""
+
+    def __init__(self, clock: Clock, deploy_seconds: float, queue_seconds: float, rng: random.Random):
+        self.clock = clock
+        self.deploy_seconds = deploy_seconds
+        self.queue_seconds = queue_seconds
+        self.rng = rng
+        self.lock = threading.Lock()
+        self.files: dict[str, dict] = {}  # repo -> {"sha", "content"}
+        self.runs: dict[str, int] = {}  # repo -> id of the run allowed to finish
+        self.pages: dict[str, list[tuple[float, str]]] = {}  # repo -> [(live at, url)]
+        self.calls: Counter = Counter()
+        self.calls_per_hour: Counter = Counter()  # (token, hour) -> calls
+        self.deploys: Counter = Counter()
+        self.put_times: dict[tuple[str, str], float] = {}
+
+    def seed(self, repo: str, url: str) -> None:
+        content = json.dumps({"name": repo.split("/")[0], "url": url}, indent=2) + "\n"
+        self.files[repo] = {"sha": hashlib.sha1(content.encode()).hexdigest(), "content": content}
+        self.pages[repo] = [(0.0, url)]
+
+    def _rate_limited(self, token: str) -> tuple[bool, int]:
+        key = (token, int(self.clock.now() // 3600))
+        self.calls_per_hour[key] += 1
+        remaining = GITHUB_RATE_LIMIT - self.calls_per_hour[key]
+        return remaining < 0, max(0, remaining)
+
+    def handle(self, method: str, repo: str, token: str, body: dict | None) -> tuple[int, dict, int]:
+        with self.lock:
+            self.calls[method] += 1
+            limited, remaining = self._rate_limited(token)
+            if limited:
+                self.calls["rate_limited"] += 1
+                return 403, {"message": "API rate limit exceeded"}, remaining
+            current = self.files.get(repo)
+            if method == "GET":
+                if not current:
+                    return 404, {"message": "Not Found"}, remaining
+                content = base64.b64encode(current["content"].encode()).decode()
+                return 200, {"sha": current["sha"], "content": content}, remaining
+
+            if current and (body or {}).get("sha") != current["sha"]:
+                self.calls["conflict"] += 1
+                return 409, {"message": "server.json does not match sha"}, remaining
+            content = base64.b64decode(body["content"]).decode()
+            sha = hashlib.sha1(f"{content}{self.clock.now()}".encode()).hexdigest()
+            self.files[repo] = {"sha": sha, "content": content}
+            url = json.loads(content)["url"]
+            self.put_times[(repo, url)] = self.clock.now()
+            self._start_run(repo, url)
+            return 200, {"content": {"sha": sha}, "commit": {"sha": sha}}, remaining
+
+    def _start_run(self, repo: str, url: str) -> None:
+        """Push to main starts a deploy; concurrency group `pages` cancels the previous one."""
+        if self.runs.get(repo):
+            self.deploys["cancelled"] += 1
+        self.deploys["started"] += 1
+        run_id = self.deploys["started"]
+        self.runs[repo] = run_id
+        delay = self.queue_seconds * self.rng.uniform(0.5, 1.5) + self.deploy_seconds * self.rng.uniform(0.8, 1.3)
+        timer = threading.Timer(delay / self.clock.speed, self._finish_run, args=(repo, run_id, url))
+        timer.daemon = True
+        timer.start()
+
+    def _finish_run(self, repo: str, run_id: int, url: str) -> None:
+        with self.lock:
+            if self.runs.get(repo) != run_id:
+                return
+            self.runs[repo] = 0
+            self.deploys["completed"] += 1
+            self.pages[repo].append((self.clock.now(), url))
+
+    def serve(self) -> ThreadingHTTPServer:
+        github = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _handle(self, method: str) -> None:
+                parts = self.path.strip("/").split("/")
+                if len(parts) != 5 or parts[0] != "repos" or parts[3:] != ["contents", "server.json"]:
+                    code, payload, remaining = 404, {"message": "Not Found"}, GITHUB_RATE_LIMIT
+                else:
+                    body = None
+                    if method == "PUT":
+                        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)))
+                    token = self.headers.get("Authorization", "").removeprefix("Bearer ")
+                    code, payload, remaining = github.handle(method, f"{parts[1]}/{parts[2]}", token, body)
+                data = json.dumps(payload).encode()
+                self.send_response(code)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.send_header("X-RateLimit-Remaining", str(remaining))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def do_GET(self):
+                self._handle("GET")
+
+            def do_PUT(self):
+                self._handle("PUT")
+
+            def log_message(self, format, *args):
+                pass
+
+        class Server(ThreadingHTTPServer):
+            daemon_threads = True
+            request_queue_size = 1024  # a restart storm opens one connection per node at once
+
+        server = Server(("127.0.0.1", 0), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+class Node:
+    """One mesh member: fake cloudflared logs plus the real watcher loop."""
+
+    def __init__(self, index: int, sim: "Simulation"):
+        self.sim = sim
+        self.name = f"node{index:03d}"
+        self.repo = f"{self.name}/frederick-matrix"
+        self.token = f"token-{self.name}"
+        self.log_lines: list[str] = []
+        self.lock = threading.Lock()
+        self.current_url = self._new_url()
+        sim.github.seed(self.repo, self.current_url)
+
+    def _new_url(self) -> str:
+        url = f"https://sim-{secrets.token_hex(5)}.trycloudflare.com"
+        with self.lock:
+            self.log_lines.append("INF Requesting new quick Tunnel on trycloudflare.com...")
+            self.log_lines.append(f"INF |  {url}  |")
+            self.log_lines.append("INF Registered tunnel connection connIndex=0 protocol=quic")
+        return url
+
+    def restart(self) -> None:
+        url = self._new_url()
+        self.sim.record_change(self, url)
+
+    def logs(self) -> str:
+        with self.lock:
+            return "\n".join(self.log_lines[-LOG_TAIL:])
+
+    def publish_url(self, url: str) -> None:
+        self.sim.detected.setdefault(url, self.sim.clock.now())
+        watcher.publish(url, self.token, self.repo, self.name)
+
+    def run(self, poll_interval: float, stop: threading.Event) -> None:
+        clock = self.sim.clock
+        clock.sleep(self.sim.rng.uniform(0, poll_interval))
+        while not stop.is_set():
+            url = watcher.latest_tunnel_url(self.logs())
+            self.current_url = watcher.check_url(url, self.current_url, self.publish_url)
+            clock.sleep(poll_interval)
+
+
+class Simulation:
+    def __init__(self, args):
+        self.args = args
+        self.rng = random.Random(args.seed)
+        self.clock = Clock(args.speed)
+        self.github = FakeGitHub(self.clock, args.deploy_seconds, args.queue_seconds, self.rng)
+        self.nodes = [Node(i, self) for i in range(args.nodes)]
+        self.phases = {node.name: self.rng.uniform(0, args.peer_poll) for node in self.nodes}
+        self.changes: list[dict] = []
+        self.detected: dict[str, float] = {}
+        self.lock = threading.Lock()
+
+    def record_change(self, node: Node, url: str) -> None:
+        with self.lock:
+            self.changes.append({"node": node, "url": url, "t0": self.clock.now()})
+
+    def schedule(self) -> list[tuple[float, Node]]:
+        """Restart times: a Poisson process per node, flaps, and an optional storm."""
+        args = self.args
+        events = []
+        rate = args.restarts / 3600
+        for node in self.nodes:
+            t = self.rng.expovariate(rate) if rate else math.inf
+            while t < args.duration:
+                events.append((t, node))
+                if self.rng.random() < args.flap:
+                    events.append((t + self.rng.uniform(5, 30), node))
+                t += self.rng.expovariate(rate)
+        if args.storm is not None:
+            events.extend((args.storm + self.rng.uniform(0, 5), node) for node in self.nodes)
+        return sorted(events, key=lambda e: e[0])
+
+    def run(self) -> None:
+        args = self.args
+        server = self.github.serve()
+        watcher.GITHUB_API = f"http://127.0.0.1:{server.server_address[1]}"
+        events = self.schedule()
+        settle = args.poll_interval + (args.queue_seconds * 1.5 + args.deploy_seconds * 1.3) + 10
+        print(
+            f"Simulating {args.nodes} nodes for {args.duration:.0f}s (+{settle:.0f}s settle) "
+            f"at {args.speed:g}x: {len(events)} tunnel restarts scheduled..."
+        )
+
+        stop = threading.Event()
+        for node in self.nodes:
+            threading.Thread(target=node.run, args=(args.poll_interval, stop), daemon=True).start()
+        for at, node in events:
+            self.clock.sleep_until(at)
+            node.restart()
+        self.clock.sleep_until(args.duration + settle)
+        stop.set()
+        self.end = self.clock.now()
+        server.shutdown()
+
+    def analyze(self) -> list[dict]:
+        """Follow each URL change through detect, PUT, deploy and peer polling."""
+        poll = self.args.peer_poll
+        results = []
+        with self.github.lock:
+            pages = {repo: list(history) for repo, history in self.github.pages.items()}
+            put_times = dict(self.github.put_times)
+        for change in self.changes:
+            node, url, t0 = change["node"], change["url"], change["t0"]
+            result = {"t0": t0, "outcome": "unfinished", "detected": self.detected.get(url)}
+            result["put"] = put_times.get((node.repo, url))
+            history = pages[node.repo]
+            live_index = next((i for i, (_, u) in enumerate(history) if u == url), None)
+            newer_change = any(c["node"] is node and c["t0"] > t0 for c in self.changes)
+            if live_index is None:
+                result["outcome"] = "superseded" if newer_change else "unfinished"
+                results.append(result)
+                continue
+            live = history[live_index][0]
+            replaced = history[live_index + 1][0] if live_index + 1 < len(history) else math.inf
+            seen = [
+                live + (phase - live) % poll
+                for name, phase in self.phases.items()
+                if name != node.name
+            ]
+            result["live"] = live
+            if max(seen) >= replaced:
+                result["outcome"] = "superseded"
+            else:
+                result["outcome"] = "converged"
+                result["converged"] = max(seen)
+            results.append(result)
+        return results
+
+    def report(self) -> None:
+        args = self.args
+        results = self.analyze()
+        outcomes = Counter(r["outcome"] for r in results)
+        done = [r for r in results if r["outcome"] == "converged"]
+
+        print(f"\n--- URL changes ({len(results)}) ---")
+        print("  " + ", ".join(f"{n} {outcome}" for outcome, n in sorted(outcomes.items())))
+        print(f"\n{'STAGE':<26} {'P50':>8} {'P95':>8} {'MAX':>8}")
+        stages = [
+            ("restart -> detected", [r["detected"] - r["t0"] for r in results if r["detected"] is not None]),
+            ("detected -> PUT accepted", [r["put"] - r["detected"] for r in results if r["put"] and r["detected"]]),
+            ("PUT -> Pages live", [r["live"] - r["put"] for r in results if r.get("live") and r["put"]]),
+            ("Pages live -> all peers", [r["converged"] - r["live"] for r in done]),
+            ("restart -> converged", [r["converged"] - r["t0"] for r in done]),
+        ]
+        for label, values in stages:
+            print(
+                f"{label:<26} {fmt(percentile(values, 50)):>8} {fmt(percentile(values, 95)):>8} "
+                f"{fmt(max(values) if values else None):>8}"
+            )
+
+        github = self.github
+        api_calls = github.calls["GET"] + github.calls["PUT"]
+        print("\n--- GitHub API ---")
+        print(f"  Calls: {api_calls} ({github.calls['GET']} GET, {github.calls['PUT']} PUT), "
+              f"{api_calls / len(results) if results else 0:.2f} per URL change")
+        print(f"  Rejected: {github.calls['rate_limited']} rate-limited, {github.calls['conflict']} sha conflicts")
+        busiest = max(github.calls_per_hour.values(), default=0)
+        print(f"  Busiest token-hour: {busiest} calls ({busiest / GITHUB_RATE_LIMIT * 100:.1f}% of {GITHUB_RATE_LIMIT}/h)")
+
+        deploys = github.deploys
+        started = deploys["started"]
+        print("\n--- Pages deploys ---")
+        print(f"  Started {started}, completed {deploys['completed']}, "
+              f"cancelled {deploys['cancelled']} ({deploys['cancelled'] / started * 100 if started else 0:.1f}%)")
+
+        fetches = args.nodes * (args.nodes - 1) * 3600 / args.peer_poll
+        print("\n--- Peer fan-out (server.json fetches) ---")
+        print(f"  {fetches:,.0f}/h across the mesh, {(args.nodes - 1) * 3600 / args.peer_poll:,.0f}/h served by each node's Pages site")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Simulate tunnel URL propagation across a mesh")
+    parser.add_argument("--nodes", type=int, default=50, help="Mesh size (default: 50)")
+    parser.add_argument("--duration", type=float, default=3600, help="Simulated seconds of restarts (default: 3600)")
+    parser.add_argument("--speed", type=float, default=60, help="Simulated seconds per real second (default: 60)")
+    parser.add_argument("--restarts", type=float, default=1, help="Tunnel restarts per node per hour (default: 1)")
+    parser.add_argument("--flap", type=float, default=0.1, help="Chance a restart is followed by another within 30s (default: 0.1)")
+    parser.add_argument("--storm", type=float, metavar="T", help="Also restart every node at simulated time T")
+    parser.add_argument("--poll-interval", type=float, default=60, help="Watcher POLL_INTERVAL (default: 60)")
+    parser.add_argument("--peer-poll", type=float, default=300, help="How often peers re-fetch server.json (default: 300)")
+    parser.add_argument("--deploy-seconds", type=float, default=45, help="Pages workflow run time (default: 45)")
+    parser.add_argument("--queue-seconds", type=float, default=10, help="Workflow queue time (default: 10)")
+    parser.add_argument("--seed", type=int, help="Random seed for a reproducible schedule")
+    parser.add_argument("-v", "--verbose", action="store_true", help="Show watcher log output")
+    args = parser.parse_args()
+    if args.nodes < 2:
+        parser.error("--nodes must be at least 2")
+
+    logging.getLogger("watcher").setLevel(logging.INFO if args.verbose else logging.WARNING)
+    sim = Simulation(args)
+    sim.run()
+    sim.report()
+
+
+if __name__ == "__main__":
+    main()
@@ -7,6 +7,13 @@ Reads env vars:
   NODE_NAME              - short name for this node, e.g. "david-wolgemuth"
   POLL_INTERVAL          - seconds between checks (default: 60)
   CLOUDFLARED_CONTAINER  - name of cloudflared container (default: "cloudflared")
+  HEALTH_PORT            - port for /healthz and /metrics (default: 8081)
+  GITHUB_API_URL         - GitHub API base (default: https://api.github.com)
+  GOSSIP_*, PEERS_FILE   - peer URL gossip, see gossip.py
+
+/healthz returns 503 once the main loop has not completed for
+STALE_LOOPS poll intervals; a watchdog exits the process a little later so
+Docker's restart policy brings it back.
 """
 
 import base64
@@ -15,11 +22,15 @@ import logging
 import os
 import re
 import sys
+import threading
 import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
 
 import docker
 import requests
 
+import gossip
+
 logging.basicConfig(
     format="%(asctime)s [watcher] %(levelname)s %(message)s",
     datefmt="%H:%M:%S",
@@ -28,6 +39,19 @@ logging.basicConfig(
 log = logging.getLogger(__name__)
 
 TUNNEL_URL_PATTERN = re.compile(r"https://[a-zA-Z0-9-]+\.trycloudflare\.com")
+GITHUB_API = os.environ.get("GITHUB_API_URL", "https://api.github.com").rstrip("/")
+STALE_LOOPS = 3
+WATCHDOG_LOOPS = 5
+
+# Internal metrics, served at /metrics.
+stats = {
+    "log_scan_seconds": 0.0,
+    "publish_latency_seconds": 0.0,
+    "publish_success_total": 0,
+    "publish_failure_total": 0,
+    "github_rate_limit_remaining": -1,
+    "last_loop_time": time.time(),
+}
 
 
 def get_env(key: str) -> str:
@@ -44,23 +68,35 @@ def read_tunnel_url(container_name: str) -> str | None:
         client = docker.from_env()
         container = client.containers.get(container_name)
         logs = container.logs(tail=100).decode("utf-8", errors="replace")
-        urls = TUNNEL_URL_PATTERN.findall(logs)
-        return urls[-1] if urls else None
+        return latest_tunnel_url(logs)
     except Exception as exc:
         log.debug("Could not read container logs: %s", exc)
         return None
 
 
-def publish(url: str, github_token: str, github_repo: str, node_name: str) -> None:
-    """PUT server.json to the GitHub Contents API."""
-    api_base = f"https://api.github.com/repos/{github_repo}/contents/server.json"
+def latest_tunnel_url(logs: str) -> str | None:
+    """The last tunnel URL cloudflared logged, if any."""
+    urls = TUNNEL_URL_PATTERN.findall(logs)
+    return urls[-1] if urls else None
+
+
+def publish(url: str, github_token: str, github_repo: str, node_name: str, gossip_key: str | None = None) -> None:
+    """PUT server.json to the GitHub Contents API.
+
+    `gossip_key` is this node's public gossip key; peers use the copy on
+    Pages to verify gossiped URLs.
+    """
+    api_base = f"{GITHUB_API}/repos/{github_repo}/contents/server.json"
     headers = {
         "Authorization": f"Bearer {github_token}",
         "Accept": "application/vnd.github+json",
         "X-GitHub-Api-Version": "2022-11-28",
     }
 
-    server_json = json.dumps({"name": node_name, "url": url}, indent=2) + "\n"
+    data = {"name": node_name, "url": url}
+    if gossip_key:
+        data["key"] = gossip_key
+    server_json = json.dumps(data, indent=2) + "\n"
     content_b64 = base64.b64encode(server_json.encode()).decode()
 
     # Fetch current SHA (needed for updates)
@@ -77,10 +113,92 @@ def publish(url: str, github_token: str, github_repo: str, node_name: str) -> No
         payload["sha"] = sha
 
     resp = requests.put(api_base, headers=headers, json=payload, timeout=10)
-    if resp.ok:
-        log.info("Published: %s", url)
-    else:
-        log.error("GitHub API error %s: %s", resp.status_code, resp.text[:200])
+    remaining = resp.headers.get("X-RateLimit-Remaining")
+    if remaining is not None:
+        stats["github_rate_limit_remaining"] = int(remaining)
+    if not resp.ok:
+        # Logged once, by the caller.
+        raise requests.HTTPError(f"GitHub API error {resp.status_code}: {resp.text[:200]}", response=resp)
+    log.info("Published: %s", url)
+
+
+def check_url(url: str | None, current_url: str | None, publish_url, node=None) -> str | None:
+    """One pass of the main loop: publish `url` if it changed.
+
+    `publish_url(url)` does the actual publish; returns the URL that is
+    now published (unchanged if the publish failed, so it is retried).
+    """
+    if not url:
+        log.debug("No tunnel URL yet, waiting...")
+        return current_url
+    if url == current_url:
+        return current_url
+
+    log.info("Detected tunnel URL: %s", url)
+    detected = time.monotonic()
+    if node is not None:
+        node.set_self(url)
+    try:
+        publish_url(url)
+    except Exception as exc:
+        stats["publish_failure_total"] += 1
+        log.error("Publish failed: %s", exc)
+        return current_url
+    stats["publish_success_total"] += 1
+    stats["publish_latency_seconds"] = time.monotonic() - detected
+    return url
+
+
+def render_metrics() -> str:
+    """Prometheus text exposition of `stats`."""
+    lines = []
+    for key, value in stats.items():
+        if key == "last_loop_time":
+            key, value = "seconds_since_last_loop", time.time() - value
+        kind = "counter" if key.endswith("_total") else "gauge"
+        lines.append(f"# TYPE tunnel_watcher_{key} {kind}")
+        lines.append(f"tunnel_watcher_{key} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def serve_health(port: int, poll_interval: int) -> None:
+    """Serve /healthz and /metrics in a background thread."""
+    stale_after = poll_interval * STALE_LOOPS + 30
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path == "/healthz":
+                age = time.time() - stats["last_loop_time"]
+                healthy = age < stale_after
+                code, body = (200, "ok\n") if healthy else (503, f"stale: last loop {age:.0f}s ago\n")
+            elif self.path == "/metrics":
+                code, body = 200, render_metrics()
+            else:
+                code, body = 404, "not found\n"
+            data = body.encode()
+            self.send_response(code)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def log_message(self, format, *args):
+            log.debug("health: " + format, *args)
+
+    server = ThreadingHTTPServer(("0.0.0.0", port), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    log.info("Health endpoint on :%s (/healthz, /metrics)", port)
+
+
+def watchdog(poll_interval: int) -> None:
+    """Exit the process if the main loop hangs, so Docker restarts us."""
+    limit = poll_interval * WATCHDOG_LOOPS + 60
+    while True:
+        time.sleep(poll_interval)
+        age = time.time() - stats["last_loop_time"]
+        if age > limit:
+            log.error("Main loop stalled for %.0fs, exiting for restart", age)
+            os._exit(1)
 
 
 def main() -> None:
@@ -89,25 +207,29 @@ def main() -> None:
     node_name = get_env("NODE_NAME")
     container_name = os.environ.get("CLOUDFLARED_CONTAINER", "cloudflared")
     poll_interval = int(os.environ.get("POLL_INTERVAL", "60"))
+    health_port = int(os.environ.get("HEALTH_PORT", "8081"))
 
     log.info("Starting tunnel watcher (poll every %ss)", poll_interval)
     log.info("Repo: %s  Node: %s", github_repo, node_name)
 
+    serve_health(health_port, poll_interval)
+    node = gossip.start(node_name)
+    gossip_key = gossip.public_key_b64(node.key)
+    threading.Thread(target=watchdog, args=(poll_interval,), daemon=True).start()
+
     current_url: str | None = None
 
+    def publish_url(url: str) -> None:
+        publish(url, github_token, github_repo, node_name, gossip_key)
+
     while True:
+        scan_start = time.monotonic()
         url = read_tunnel_url(container_name)
+        stats["log_scan_seconds"] = time.monotonic() - scan_start
 
-        if url and url != current_url:
-            log.info("Detected tunnel URL: %s", url)
-            try:
-                publish(url, github_token, github_repo, node_name)
-                current_url = url
-            except Exception as exc:
-                log.error("Publish failed: %s", exc)
-        elif not url:
-            log.debug("No tunnel URL yet, waiting...")
+        current_url = check_url(url, current_url, publish_url, node)
 
+        stats["last_loop_time"] = time.time()
         time.sleep(poll_interval)
 
 